@@ -29,139 +29,126 @@ dependent GUI's started as subprocesses in circa line 1150:
 
 from decimal import *
 from math import *
-from pyglet import gl, image, text as tt, window as ww
+from collections import OrderedDict, namedtuple
 import time
 import operator 
+import heapq
 import subprocess
+import cPickle
+import select
+import ctypes
+import ctypes.util
+import glob
+import threading
+import Queue
+import socket
+import multiprocessing
+import argparse
+import sys
 import os
 import serial
+try:
+	import numpy   # Optional, only needed by decode_batch() and TargetTable
+except ImportError:
+	numpy = None
 
 
 # ##################################################################
 # ------------------------- Functions ------------------------------
 # ##################################################################
 
-def negate_2s_compl( binary_string ):
-	
-	''' Standard binary negation: complement all the bits, add 1.
-
-		Algorithm:
-		1) First invert all bits
-		2) "Add 1" to Least Significant bit by:
-		A) Start at rightmost bit, re-invert each '1';
-		B) Re-invert rightmost '0' and stop there.
+class BitBuffer(object):
+	''' An AIS payload bitstream held as one long integer.
 
-		This code builds "negated_string" as a _list_ of bits,
-		then converts the list to a string.
-		(Python handles lists better than strings.)
+	Bit 0 of the stream is the most significant bit of value, so a
+	field is cut out with a single shift and mask instead of slicing
+	and re-joining lists of '0'/'1' characters. Bits read past the end
+	of the buffer come back as zeros, the way the AIS spec pads short
+	messages.
+	'''
+	__slots__ = ('value', 'length')
+
+	def __init__(self, value=0, length=0):
+		self.value = value
+		self.length = length
+
+	def __len__(self):
+		return self.length
+
+	def __add__(self, other):
+		''' Concatenates two buffers, e.g. the fragments of a multipart message.'''
+		return BitBuffer((self.value << other.length) | other.value,
+			self.length + other.length)
+
+	def get_uint(self, offset, width):
+		''' Returns the unsigned integer held in bits [offset, offset+width).'''
+		shift = self.length - offset - width
+		if shift >= 0:
+			return (self.value >> shift) & ((1 << width) - 1)
+		return (self.value << -shift) & ((1 << width) - 1)
+
+	def get_int(self, offset, width):
+		''' Returns the two's complement signed integer held in bits
+		[offset, offset+width).
+		'''
+		n = self.get_uint(offset, width)
+		if n >> (width - 1):
+			n -= 1 << width
+		return n
+
+
+def coordCheck(lati, longi):
+	''' Takes a decoded position in decimal degrees. The "not available"
+	values, 91 and 181 degrees, are out of bounds just like any other 
+	goofy coordinate.
+	
+	Returns the latitude, the longitude, and an error flag: 'ok', or
+	'01' for a latitude out of bounds, '02' for a longitude ditto. 
+	A goofy coordinate is returned as 0.0.
 	'''
-	negated_string = []
 
-	for b in binary_string:     # Invert all bits, left to right
-		negated_string.append( bitComplement[b] )
+	flag = 'ok'
+	if not -90.0 < lati < 90.0:
+		lati = 0.0
+		flag = '01'	# Flag: Something is utterly wrong here! (Goofy LAT value)
+	if not -180.0 < longi < 180.0:
+		longi = 0.0
+		flag = '02'    # Flag: Something is utterly wrong here! (Goofy LON value)
+	return lati, longi, flag
 
-	for i in range(len(negated_string)-1, -1, -1):  # start at right, work left
-		if negated_string[i] == '1':
-			negated_string[i] = '0'
-		else:
-			negated_string[i] = '1'
-		break       # Re-invert the rightmost '0', then stop.
 
-	return ''.join(negated_string)  # turn list of chars into text string
+def coord2text(degrees, positive, negative):
+	''' Takes a coordinate in decimal degrees, and the cardinal signs
+	for its positive and negative halves.
+	
+	Returns a formatted position string, e.g. '59.463333 N'.
+	'''
+
+	if degrees < 0:
+		return '%s %s' % (round(-degrees, 6), negative)
+	return '%s %s' % (round(degrees, 6), positive)
 
 
 '''
 -------------------------------------------------------------------
-The following three functions return signed decimal representations 
-of a two's complimentary bitstring of arbitrary length.
+The following function returns a signed decimal representation 
+of a two's complement field, as sign extended by the field spec.
 -------------------------------------------------------------------
 '''
 
-def lon_2sC_Decoder( bitString ):
-	''' Takes an arbitrary length string of signed two's complement
-	binary numeric value.
-	
-	Returns a decimal Longitude (East/West) formatted position string.
-	'''
-	global spurio
-	
-	if bitString[0] == '1':
-		isNegative = True
-		magnitude_BINA = negate_2s_compl( bitString[1:])
-	else:
-		isNegative = False
-		magnitude_BINA = bitString
-
-	magnitude_DECI = str(round(int(magnitude_BINA , base=2)/Decimal(600000), 6))
-
-	if float(magnitude_DECI) >= float('180.0'):    # Avoid comparing strings for size
-		magnitude_DECI = '0.0'
-		spurio = '02'    # Flag: Something is utterly wrong here! (Goofy LON vslue)
-	else:
-		spurio = 'ok'
-	if isNegative:
-		magnitude_DECI = ''.join(magnitude_DECI + ' W')
-	else:
-		magnitude_DECI = ''.join(magnitude_DECI + ' E')
-			
-	return magnitude_DECI
-	
-
-def lat_2sC_Decoder( bitString ):
-	''' Takes an arbitrary length string of signed two's complement
-	binary numeric value.
-	
-	Returns a decimal Latitude (North/South) formatted position string.
-	'''
-	global spurio
-
-	if bitString[0] == '1':
-		isNegative = True
-		magnitude_BINA = negate_2s_compl( bitString[1:])
-	else:
-		isNegative = False
-		magnitude_BINA = bitString
-
-	magnitude_DECI = str(round(int(magnitude_BINA , base=2)/Decimal(600000), 6))
-	
-	if float(magnitude_DECI) >= float('90.0'):
-		magnitude_DECI = '0.0'
-		spurio = '01'	# Flag: Something is utterly wrong here! (Goofy LAT value)
-	else:
-		spurio = 'ok'
-	if isNegative:
-		magnitude_DECI = ''.join(magnitude_DECI + ' S')
-	else:
-		magnitude_DECI = ''.join(magnitude_DECI + ' N')
-			
-	return magnitude_DECI
-	
-
-def rot_2sC_Decoder( bitString ):
-	''' Takes an arbitrary length string of signed two's complement
-	binary numeric value.
+def rot_2sC_Decoder( signedValue ):
+	''' Takes a signed 8 bit rate of turn field value.
 	
 	Returns a decimal rotation value, as a port/starboard formatted string.
 	'''
 
-	if  '1' not in bitString:
-		magnitude_DECI = '--'
-		
-	elif bitString == '10000000':
+	if signedValue == 0 or signedValue == -128:
 		magnitude_DECI = '--'
 		
 	else:
+		magnitude_DECI = str(trunc((abs(signedValue)/ Decimal(4733)*1000)**2))
 		
-		if bitString[0] == '1':
-			isNegative = True
-			magnitude_BINA = negate_2s_compl( bitString[1:])
-		else:
-			isNegative = False
-			magnitude_BINA = bitString
-
-		magnitude_DECI = str(trunc(((int(magnitude_BINA, base=2))/ Decimal(4733)*1000)**2))
-		
-		if isNegative:
+		if signedValue < 0:
 			magnitude_DECI = ''.join('<-- ' + magnitude_DECI + ' <--')
 		else:
 			magnitude_DECI = ''.join('--> ' + magnitude_DECI + ' -->')
@@ -170,14 +157,12 @@ def rot_2sC_Decoder( bitString ):
 	
 
 
-def sog_cog_BinValueDecoder( bitString ):
-	''' Takes an arbitrary length string of binary numeric value.
+def sog_cog_BinValueDecoder( value ):
+	''' Takes a speed or course value, already scaled from tenths.
 	
 	Returns a decimal value, as a string.
 	'''      
-	magnitude_BINA = bitString
-
-	magnitude_DECI = str((int(magnitude_BINA , base=2))/Decimal (10))
+	magnitude_DECI = '%g' % value
 
 	return magnitude_DECI
 
@@ -201,74 +186,533 @@ def checkSumCheck(sentence):
 	return nmeadata, int(cksum, 16), calc_cksum
 
 	
-def int2bin(n, count=6):
-	''' Returns the binary of integer value n, using count number of digits.
+def sixBit2ASCIIchar(n, width):
+	''' Takes an integer holding width/6 six-bit chars, first char in
+	the most significant bits.
+	
+	Returns a string of chars mapped from the NMEA ASCII 
+	"Sixbit" chars set, with the '@' padding chars and any trailing
+	blanks left out.
 	'''
 	
-	return ''.join([str((n >> y) & 1) for y in range(count-1, -1, -1)])
+	sxb = bytearray([(n >> s) & 63 for s in range(width - 6, -1, -6)])
+	return str(sxb.translate(sixBitASCIItable, '\x00')).rstrip()
+	
+
+def sixBit2ICAO(chars):
+	''' Takes a string of chars decoded by sixBit2ASCIIchar().
+	
+	Returns a verbose string spelled out in ICAO "signalese"!
+	'''
+	
+	return ''.join(map(sixBitICAOdict.__getitem__, chars))
 
 
-def str2Bitstr(s):
-	return ''.join(s)
+def fieldExpr(field, msgLength):
+	''' Returns the Python expression decoding one spec field out of v,
+	a payload value aligned to msgLength bits.
+	'''
+	
+	name, offset, width, kind = field[:4]
+	expr = '(v >> %d) & %d' % (msgLength - offset - width, (1 << width) - 1)
+	if kind == 'i':   # Sign extension: flip the sign bit, subtract its weight
+		expr = '((%s) ^ %d) - %d' % (expr, 1 << (width - 1), 1 << (width - 1))
+	elif kind == 't':
+		expr = 'sixBit2ASCIIchar(%s, %d)' % (expr, width)
+	if len(field) > 4:
+		expr = '(%s) / %r' % (expr, float(field[4]))
+	return expr
+
 
-def sixBit2ASCIIchar(sxb):
-	''' Takes a string of 120 bits.
+def buildExtractor(msgLength, result):
+	''' Generates a function that pads or trims a BitBuffer to msgLength
+	bits, as v, and returns the result expression.
+	'''
 	
-	Returns a string of chars mapped from the NMEA ASCII 
-	"Sixbit" chars set.
+	source = '\n'.join([
+		'def extract(payload):',
+		'    v = payload.value',
+		'    n = payload.length',
+		'    if n < %d: v <<= %d - n' % (msgLength, msgLength),
+		'    elif n > %d: v >>= n - %d' % (msgLength, msgLength),
+		'    return ' + result])
+	namespace = {'sixBit2ASCIIchar': sixBit2ASCIIchar}
+	exec source in namespace
+	return namespace['extract']
+
+
+def compileSpec(spec, names=None):
+	''' Compiles the field spec of one message type into an extractor.
+	
+	The spec is a list of (name, offset, width, kind[, scale]) tuples,
+	kind being 'u' (unsigned), 'i' (signed) or 't' (six-bit text). A 
+	numeric field with a scale is divided by it. The generated function
+	pads or trims the payload to the spec's length once and then cuts
+	every field out with constant shifts and masks, in a single dict 
+	display. If names is given, only those fields are decoded.
+	
+	Returns a function taking a BitBuffer and returning a dict of
+	decoded field values.
 	'''
 	
-	sixBitASCIIdict = {'000000' : '@','000001' : 'A','000010' : 'B','000011' : 'C','000100' : 'D','000101' : 'E','000110' : 'F','000111' : 'G','001000' : 'H','001001' : 'I','001010' : 'J','001011' : 'K','001100' : 'L','001101' : 'M','001110' : 'N','001111' : 'O','010000' : 'P','010001' : 'Q','010010' : 'R','010011' : 'S','010100' : 'T','010101' : 'U','010110' : 'V','010111' : 'W','011000' : 'X','011001' : 'Y','011010' : 'Z','011011' : '[','011100' : '\\','011101' : ']','011110' : '\^','011111' : '_','100000' : ' ','100001' : '!','100010' : '"','100011' : '\#','100100' : '$','100101' : '%','100110' : '&','100111' : '\'','101000' : '(','101001' : ')','101010' : '\*','101011' : '\+','101100' : ',','101101' : '-','101110' : '.','101111' : '/','110000' : '0','110001' : '1','110010' : '2','110011' : '3','110100' : '4','110101' : '5','110110' : '6','110111' : '7','111000' : '8','111001' : '9','111010' : ':','111011' : ';','111100' : '<','111101' : '=','111110' : '>','111111' : '?'}
+	msgLength = max([field[1] + field[2] for field in spec])
+	fields = [field for field in spec if names is None or field[0] in names]
+	if names is not None and len(fields) != len(names):
+		raise KeyError('No such field(s): %s' % ', '.join(
+			set(names) - set([field[0] for field in spec])))
+	return buildExtractor(msgLength, '{' + ', '.join(['%r: %s' % 
+		(field[0], fieldExpr(field, msgLength)) for field in fields]) + '}')
 
-		
-	SXB = []
-	asciiChars = []
-
-	for i in range(len(sxb)/6):
-		temp = sxb[:6]
-		temp.join(temp)
-		SXB.append(temp)
-		sxb = sxb[6:]
-
-	for i in SXB:
-		if i in sixBitASCIIdict:
-			if i != '000000':
-				temp2 = sixBitASCIIdict[i]
-				asciiChars.append(temp2)
+
+def compileGetters(spec):
+	''' Compiles one getter function per field of a message type's spec.
+	
+	Returns a dict mapping each field name to a function taking a 
+	BitBuffer and returning that field's decoded value.
+	'''
+	
+	getters = {}
+	for field in spec:
+		msgLength = field[1] + field[2]
+		getters[field[0]] = buildExtractor(msgLength, fieldExpr(field, msgLength))
+	return getters
+
+
+class AISMessage(object):
+	''' A message whose fields are decoded only when first read.
+	
+	The raw payload is kept, and msg['name'] decodes that single field
+	with its compiled getter, caching the value. A consumer that declares
+	up front which fields it will read gets them all from one compiled
+	subset extractor, and the other fields are never touched.
+	'''
+	__slots__ = ('msgId', 'payload', 'values')
+
+	def __init__(self, msgId, payload, fields=None):
+		self.msgId = msgId
+		self.payload = payload
+		if fields:
+			self.values = subsetExtractor(msgId, fields)(payload)
 		else:
-			print 'Say what?'
+			self.values = {}
+
+	def __getitem__(self, name):
+		values = self.values
+		if name in values:
+			return values[name]
+		value = values[name] = fieldGetters[self.msgId][name](self.payload)
+		return value
+
+	def __contains__(self, name):
+		return name in fieldGetters[self.msgId]
+
+	def decodeAll(self):
+		''' Decodes all the fields not read so far.
 		
-	return ''.join(asciiChars)
+		Returns the dict of field values.
+		'''
+		if len(self.values) < len(fieldGetters[self.msgId]):
+			self.values = msgExtractors[self.msgId](self.payload)
+		return self.values
+
+
+def subsetExtractor(msgId, fields):
+	''' Returns the compiled extractor for the given tuple of field names
+	of a message type, compiling it on first use.
+	'''
 	
+	key = (msgId, fields)
+	if key not in subsetExtractors:
+		subsetExtractors[key] = compileSpec(msgSpecs[msgId], fields)
+	return subsetExtractors[key]
 
-def sixBit2ICAO(sxb):
-	''' Takes a string of 42 bits (7 sixbit chars).
+
+def extractFields(payload, fields=None):
+	''' Wraps a payload in an AISMessage keyed by its message type. Type 
+	24 comes in two parts, A and B, with different layouts, so these are
+	keyed by (24, part number). The optional fields tuple names the 
+	fields the caller is going to read, to be decoded in one go.
 	
-	Returns a verbose string spelled out in ICAO "signalese"!
+	Returns the AISMessage, or None for unsupported types.
 	'''
 	
-	verboseDict = {'000000' : '@','000001' : '-Alfa','000010' : '-Bravo','000011' : '-Charlie','000100' : '-Delta','000101' : '-Echo','000110' : '-Foxtrot','000111' : '-Golf','001000' : '-Hotel','001001' : '-India','001010' : '-Juliet','001011' : '-Kilo','001100' : '-Lima','001101' : '-Mike','001110' : '-November','001111' : '-Oscar','010000' : '-Papa','010001' : '-Quebec','010010' : '-Romeo','010011' : '-Sierra','010100' : '-Tango','010101' : '-Uniform','010110' : '-Victor','010111' : '-Whiskey','011000' : '-XRay','011001' : '-Yankee','011010' : '-Zulu','011011' : '[','011100' : '\\','011101' : ']','011110' : '\^','011111' : 'g\_','100000' : ' ','100001' : '!','100010' : '"','100011' : '\#','100100' : '$','100101' : '%','100110' : '&','100111' : '\'','101000' : '(','101001' : ')','101010' : '\*','101011' : '\+','101100' : ',','101101' : '-','101110' : '.','101111' : '/','110000' : '-0','110001' : '-1','110010' : '-2','110011' : '-3','110100' : '-4','110101' : '-5','110110' : '-6','110111' : '-7','111000' : '-8','111001' : '-9','111010' : ':','111011' : ';','111100' : '<','111101' : '=','111110' : '>','111111' : '?'}
+	msgId = payload.get_uint(0, 6)
+	if msgId == 24:
+		msgId = (24, payload.get_uint(38, 2))
+	if msgId in msgSpecs:
+		return AISMessage(msgId, payload, fields)
+	return None
+
+
+def unpackPayload(armored, fillBits=0):
+	''' De-armors the payload field of an AIVDM sentence.
+	
+	Every payload char is looked up in the 256-entry armorOctal table, 
+	which gives the six bits it carries as two octal digits, so the whole 
+	payload is parsed by a single int(..., 8) call. The fillBits padding 
+	at the tail is dropped.
+	
+	Returns a BitBuffer.
+	'''
+	
+	if not armored:
+		return BitBuffer()
+	value = int(''.join(map(armorOctal.__getitem__, bytearray(armored))), 8)
+	return BitBuffer(value >> fillBits, 6 * len(armored) - fillBits)
+
+
+def charMatrix(strings, width, pad='\x00'):
+	''' Packs a list of strings into a NumPy uint8 matrix, one row per 
+	string, each padded with pad chars to width.
+	'''
+	
+	joined = ''.join([s.ljust(width, pad) for s in strings])
+	return numpy.frombuffer(joined, numpy.uint8).reshape(len(strings), width)
+
+
+def decode_batch(lines, types=(1, 2, 3, 4)):
+	''' Decodes a whole batch of AIVDM sentences, e.g. the lines of a log
+	file, column-wise with NumPy instead of one sentence at a time.
+	
+	The single-sentence messages of the given types (1 to 4 by default)
+	get their checksums verified and their payloads de-armored into one
+	bit matrix, and then each numeric field of their msgSpecs layout is 
+	cut out for all rows at once. Text fields are left out, as are 
+	sentences failing the checksum. The lines are taken batchLines at a
+	time (see decodeColumns()), so memory use stays in bounds however 
+	many there are.
+	
+	Returns a dict of NumPy arrays keyed by field name, one element per
+	decoded message, plus 'line' holding each message's index in lines.
+	A field not in a row's message type reads 0, or NaN if scaled.
+	'''
+	
+	if numpy is None:
+		raise ImportError('decode_batch() needs NumPy')
+
+	parts = []
+	chunk = []
+	first = 0
+	for line in lines:
+		chunk.append(line)
+		if len(chunk) == batchLines:
+			parts.append(decodeColumns(chunk, first, types))
+			first += len(chunk)
+			chunk = []
+	if chunk or not parts:
+		parts.append(decodeColumns(chunk, first, types))
+
+# Join the chunks' columns. A column missing from a chunk, that had no 
+# messages of its type, is filled in as above.
+	columns = {}
+	for part in parts:
+		for name in part:
+			if name not in columns:
+				columns[name] = part[name].dtype
+	for name, dtype in columns.items():
+		pieces = []
+		for part in parts:
+			if name in part:
+				pieces.append(part[name])
+			else:
+				filler = numpy.zeros(len(part['line']), dtype)
+				if dtype.kind == 'f':
+					filler.fill(numpy.nan)
+				pieces.append(filler)
+		columns[name] = numpy.concatenate(pieces)
+	return columns
+
+
+def decodeColumns(lines, first, types):
+	''' Decodes a chunk of lines for decode_batch(), the first of them 
+	being line number first. Returns the columns as decode_batch() does.
+	'''
+
+# (1) Pick out the checksummed data, the checksum and the payload field
+#     of every single-sentence message.
+	index = []
+	datas = []
+	sums = []
+	payloads = []
+	for i, line in enumerate(lines):
+		bang = line.find('!')
+		star = line.find('*', bang + 1)
+		if bang < 0 or star < 0:
+			continue
+		data = line[bang + 1:star]
+		fields = data.split(',')
+		if len(fields) < 6 or fields[1] != '1':
+			continue
+		index.append(first + i)
+		datas.append(data)
+		sums.append(line[star + 1:star + 3])
+		payloads.append(fields[5])
+	columns = {'line': numpy.array(index, numpy.int64),
+		'MessageID': numpy.zeros(len(index), numpy.int64)}
+	if not index:
+		return columns
+
+# (2) Verify all the checksums in one go.
+	calc_cksum = numpy.bitwise_xor.reduce(charMatrix(datas, max(map(len, datas))), axis=1)
+	cksum = hexValues[charMatrix(sums, 2)]
+	valid = calc_cksum == cksum[:, 0] * 16 + cksum[:, 1]
+
+# (3) Keep the valid messages of our types, told by their first payload 
+#     char, and de-armor just those into a bit matrix, six bits per char
+#     (one byte per bit). Short payloads are padded with '0' chars, i.e.
+#     zero bits.
+	msgLength = max([field[1] + field[2] for t in types for field in msgSpecs[t]])
+	armored = charMatrix(payloads, max(max(map(len, payloads)), -(-msgLength // 6)), '0')
+	msgIds = armorSixBits[armored[:, 0]].astype(numpy.int64)
+	keep = valid & numpy.isin(msgIds, types)
+	armored = armored[keep]
+	msgIds = msgIds[keep]
+	columns['line'] = columns['line'][keep]
+	columns['MessageID'] = msgIds
+	sixBits = armorSixBits[armored]
+	bits = numpy.unpackbits(sixBits[:, :, numpy.newaxis], axis=2)[:, :, 2:]
+	bits = bits.reshape(len(msgIds), -1)
+
+# (4) Cut out the fields, column-wise for each message type, widening
+#     each field's bits only as it's summed up.
+	for msgId in types:
+		rows = msgIds == msgId
+		if not rows.any():
+			continue
+		for field in msgSpecs[msgId]:
+			name, offset, width, kind = field[:4]
+			if kind == 't':
+				continue
+			value = bits[rows, offset:offset + width].astype(numpy.int64).dot(
+				1 << numpy.arange(width - 1, -1, -1))
+			if kind == 'i':   # Sign extension, as in fieldExpr()
+				value = (value ^ (1 << (width - 1))) - (1 << (width - 1))
+			if len(field) > 4:
+				value = value / float(field[4])
+			if name not in columns:
+				if len(field) > 4:
+					columns[name] = numpy.empty(len(msgIds))
+					columns[name].fill(numpy.nan)
+				else:
+					columns[name] = numpy.zeros(len(msgIds), numpy.int64)
+			columns[name][rows] = value
+	return columns
+
+
+class Reassembler(object):
+	''' Collects the fragments of multi-sentence messages.
+	
+	Messages in flight are keyed by (channel, sequential message ID, 
+	parts count), so interleaved messages from channels A and B don't
+	trample on each other, and any number of parts is fine. At most 
+	maxSlots messages are held at once: the oldest one is evicted to
+	make room, and any left unfinished for maxAge seconds are dropped.
+	
+	The counters completed, evicted and orphaned tell how many messages
+	were put together, how many unfinished ones were thrown away, and
+	how many fragments turned up with no first part to join.
+	'''
+
+	def __init__(self, maxSlots=16, maxAge=10.0):
+		self.maxSlots = maxSlots
+		self.maxAge = maxAge
+		self.slots = OrderedDict()   # Oldest first: key -> (started, parts)
+		self.completed = 0
+		self.evicted = 0
+		self.orphaned = 0
+
+	def __len__(self):
+		return len(self.slots)
+
+	def add(self, partsCount, partNumber, sequentID, channel, payload, now=None):
+		''' Files one fragment, numbered partNumber of partsCount.
 		
-	SXB = []
-	asciiSpell = []
-
-	for i in range(len(sxb)/6):
-		temp = sxb[:6]
-		temp.join(temp)
-		SXB.append(temp)
-		sxb = sxb[6:]
-
-	for i in SXB:
-		if i in verboseDict:
-			if i != '000000':
-				temp2 = verboseDict[i]
-				asciiSpell.append(temp2)
-		else:
-			print 'Say again?'
+		Returns the reassembled payload BitBuffer when this was the
+		missing piece, else None. Raises ValueError for a fragment 
+		numbered outside 1..partsCount.
+		'''
+		if not 1 <= partNumber <= partsCount:
+			raise ValueError('Bad fragment number %d of %d' % (partNumber, partsCount))
+		if now is None:
+			now = time.time()
+		self.expire(now)
+		key = (channel, sequentID, partsCount)
+		if partNumber == 1:
+			if key in self.slots:    # A new message reusing an unfinished one's ID
+				del self.slots[key]
+				self.evicted += 1
+			elif len(self.slots) >= self.maxSlots:
+				self.slots.popitem(last=False)
+				self.evicted += 1
+			self.slots[key] = (now, [None] * partsCount)
+		elif key not in self.slots:
+			self.orphaned += 1
+			return None
+		parts = self.slots[key][1]
+		parts[partNumber - 1] = payload
+		if None in parts:
+			return None
+		del self.slots[key]
+		self.completed += 1
+		return reduce(operator.add, parts)
+
+	def expects(self, partsCount, sequentID, channel):
+		''' Tells whether a message matching this fragment is in flight.'''
+		return (channel, sequentID, partsCount) in self.slots
+
+	def expire(self, now):
+		''' Drops the messages that have been in flight for too long.'''
+		while self.slots:
+			key, (started, parts) = next(self.slots.iteritems())
+			if now - started < self.maxAge:
+				break
+			del self.slots[key]
+			self.evicted += 1
+
+
+class DupeFilter(object):
+	''' Remembers recently seen sentences, to drop the copies heard on
+	the other channel or through another antenna.
+	
+	Sentences are known by dupeKey(), i.e. by their payload and fill 
+	bits. A sentence is a duplicate if its key
+	was seen less than window seconds before. At most maxEntries keys
+	are kept, the least recently seen being evicted first.
+	
+	The counters hits and misses tell how many sentences were dropped
+	as duplicates and how many let through; evicted how many keys were
+	forgotten to make room.
+	'''
+
+	def __init__(self, maxEntries=256, window=3.0):
+		self.maxEntries = maxEntries
+		self.window = window
+		self.entries = OrderedDict()   # Least recently seen first: key -> first seen
+		self.hits = 0
+		self.misses = 0
+		self.evicted = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	def seen(self, key, now=None):
+		''' Returns True if key was seen within the window, else 
+		remembers it and returns False. A None key is never seen.
+		'''
+		if key is None:
+			return False
+		if now is None:
+			now = time.time()
+		first = self.entries.pop(key, None)
+		if first is not None and now - first < self.window:
+			self.entries[key] = first
+			self.hits += 1
+			return True
+		self.misses += 1
+		self.expire(now)
+		if len(self.entries) >= self.maxEntries:
+			self.entries.popitem(last=False)
+			self.evicted += 1
+		self.entries[key] = now
+		return False
+
+	def expire(self, now):
+		''' Forgets the keys that have aged out of the window.'''
+		while self.entries:
+			key, first = next(self.entries.iteritems())
+			if now - first < self.window:
+				break
+			del self.entries[key]
+
+
+class VoyageCache(object):
+	''' Remembers the last static and voyage data (type 5) payload of
+	each vessel, with the record decoded from it.
+	
+	Vessels repeat their type 5 message every six minutes, mostly 
+	unchanged; lookup() then hands back the record decoded last time.
+	At most maxVessels are kept, the least recently heard being 
+	evicted first. The counters hits, misses and evicted tell how it
+	goes.
+	'''
 
-	return ''.join(asciiSpell)##, SXB
+	def __init__(self, maxVessels=500):
+		self.maxVessels = maxVessels
+		self.entries = OrderedDict()   # Least recently heard first: MMSI -> (payload, record)
+		self.hits = 0
+		self.misses = 0
+		self.evicted = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	def lookup(self, mmsi, payload):
+		''' Returns the record stored for the vessel if its payload
+		is unchanged, else None.
+		'''
+		entry = self.entries.pop(mmsi, None)
+		if entry is None:
+			self.misses += 1
+			return None
+		self.entries[mmsi] = entry
+		if entry[0] != (payload.value, len(payload)):
+			self.misses += 1
+			return None
+		self.hits += 1
+		return entry[1]
+
+	def store(self, mmsi, payload, record):
+		''' Keeps the record decoded from the vessel's payload.'''
+		if mmsi in self.entries:
+			del self.entries[mmsi]
+		elif len(self.entries) >= self.maxVessels:
+			self.entries.popitem(last=False)
+			self.evicted += 1
+		self.entries[mmsi] = ((payload.value, len(payload)), record)
+
+
+def dupeKey(nmeadata):
+	''' Returns what tells a sentence from others: the fragment count, 
+	payload and fill bits. The sequential message ID and channel are 
+	left out, as those differ between copies.
+	
+	Follow-on fragments get None, i.e. they aren't checked: their short
+	tails often look alike for different messages. Copies of them are 
+	dropped anyway, with the copy of their first part.
+	'''
+	shortList = nmeadata.split(',')
+	if len(shortList) < 6 or shortList[2] != '1':
+		return None
+	return tuple(shortList[1:2] + shortList[5:])
 
 
+def typeChars(types):
+	''' Returns the armored chars that may start a payload of one of 
+	the message types given, i.e. the chars of their six-bit type 
+	numbers.
+	'''
+	
+	return frozenset([chr(c) for c in range(256) if int(armorOctal[c], 8) in types])
+
+
+def wantedSentence(input, wantedChars, reassembler):
+	'''
+	Peeks at the fragment header and the first armored payload char 
+	of a VDM sentence, where the message type lives.
+	
+	Returns False for sentences we'd only throw away after decoding,
+	i.e. first fragments of types whose chars aren't in wantedChars
+	(see typeChars()), and follow-on fragments of messages whose first
+	part the reassembler doesn't hold. True otherwise.
+	'''
+
+	a1 = input.find('!AIV')
+	shortList = input[a1 + 7:].split(',', 5)
+	if len(shortList) < 5 or not shortList[0].isdigit():
+		return True    # Leave the malformed ones to decapsulate()
+	if shortList[1] != '1':  ## No type here; wanted if its first part was
+		return reassembler.expects(int(shortList[0]), shortList[2], shortList[3])
+	return shortList[4][:1] in wantedChars
 
 
 def decapsulate(input):	
@@ -279,13 +723,14 @@ def decapsulate(input):
 	
 	Returns the total count of sentence fragments of the arriving 
 	message; the present fragments's number; a sequential 
-	message ID for multi-sentence messages; and a list of the 
-	significant binary digits in the sentence payload field.
+	message ID for multi-sentence messages; the radio channel; and a 
+	BitBuffer holding the significant binary digits in the sentence 
+	payload field. Raises ValueError for a sentence short of fields.
 	'''
 
 
-# (1) Cut off the end flag and checksum. We don't need them here.
-	z1 = input.find(',0*')
+# (1) Cut off the checksum. We don't need it here.
+	z1 = input.find('*')
 	shortString = input[:z1] 
 	
 # (2) Discard with the leading fluff (if any) including "!AIV..." tag.
@@ -296,42 +741,22 @@ def decapsulate(input):
 # (3) Save the usable fields.
 	shortList = []
 	shortList = shortString.split(',')
+	if len(shortList) < 5:
+		raise ValueError('Too few fields in: %s' % (input.strip()))
 	_partsCount = shortList[0] ## Count of sentence parts
 	_partNumber = shortList[1] ## 1 normally; 1, 2 etc for multi
 	_sequentID = shortList[2]  ## Sequential Message ID for multi
+	_channel = shortList[3]    ## Radio channel, A or B (if given)
 	shortString = shortList[4] ## The message's essential data part
+	_fillBits = 0
+	if len(shortList) > 5 and shortList[5].isdigit():
+		_fillBits = int(shortList[5]) ## Padding bits at the payload's tail
 
-# (4) Convert the "valid characters" of the disassembled encapsulated
-#     string into the sixbit binary strings they represent.
-	list_8bit_ascii_ords = []
-	for t in shortString[:]:
-		list_8bit_ascii_ords.append(ord(t))
-
-	list_minus48 = []
-	for i in list_8bit_ascii_ords:
-		list_minus48.append(i - 48)
-
-	list_6bit_DEC = []
-	for i in list_minus48:
-		if i > 40:
-			i = i - 8
-			list_6bit_DEC.append(i)
-		else:
-			list_6bit_DEC.append(i)  
-
-	list_6bit_BIN = []
-	for i in list_6bit_DEC:
-		list_6bit_BIN.append(int2bin(i))
-
-# (5) Reassemble the sixbit strings into a single binary string.
-	list_AllBits = []
-	for i in list_6bit_BIN:
-		
-		lst = list(i)
-		list_AllBits = list_AllBits + lst
+# (4) De-armor the "valid characters" of the disassembled encapsulated
+#     string into one integer-backed bit buffer.
+	payloadBits = unpackPayload(shortString, _fillBits)
 
-
-	return _partsCount,_partNumber,_sequentID,list_AllBits
+	return _partsCount,_partNumber,_sequentID,_channel,payloadBits
 
 
 
@@ -364,111 +789,6 @@ def statusCode2text(ns):
 
 
 
-def messageType(ID):
-	type = ''
-
-	if ID == '000001':
-		type = '01'
-	elif ID == '000010':
-		type = '02'
-	elif ID == '000011':
-		type = '03'
-	elif ID == '000100':
-		type = '04'
-	elif ID == '000101':
-		type = '05'
-	elif ID == '000110':
-		type = '06'
-	elif ID == '000111':
-		type = '07'
-	elif ID == '001000':
-		type = '08'
-	elif ID == '001001':
-		type = '09'
-	elif ID == '001010':
-		type = '10'
-	elif ID == '001011':
-		type = '11'
-	elif ID == '001100':
-		type = '12'
-	elif ID == '001101':
-		type = '13'
-	elif ID == '001110':
-		type = '14'
-	elif ID == '001111':
-		type = '15'
-	elif ID == '010000':
-		type = '16'
-	elif ID == '010001':
-		type = '17'
-	elif ID == '010010':
-		type = '18'
-	elif ID == '010011':
-		type = '19'
-	elif ID == '010100':
-		type = '20'
-	elif ID == '010101':
-		type = '21'
-	elif ID == '010110':
-		type = '22'
-	elif ID == '010111':
-		type = '23'
-	elif ID == '011000':
-		type = '24'
-	else:
-		type = 'fel brallor'
-		
-	return type
-
-
-
-def Dd2DMm_x(magn):
-	
-	global crdnl_x
-	global DEG_x
-	global MINmin2_x
-
-	crdnl_x = ''        
-	Dd_x = 0
-	DEG_x = 0
-	MINmin2_x = 0
-	DMn_x = []
-	
-	crdnl_x = magn[-1]                # Note the Cardinal sign
-	Dd_x = float(magn[:-2])           # Just the figures, please
-	DEG_x = int(Dd_x)                   # Keep the "floor"
-	MINmin2_x = round((Dd_x - DEG_x) * 60, 2) # Get decimal Minutes
-	
-	MINminFull_x = round((Dd_x - DEG_x) * 60, 6)
-	DMm_x = DEG_x, MINminFull_x, crdnl_x # Keep a string for reference
-	
-	return DMm_x
-
-
-def Dd2DMm_y(magn):
-	
-	global crdnl_y
-	global DEG_y
-	global MINmin2_y
-
-	crdnl_y = ''        
-	Dd_y = 0
-	DEG_y = 0
-	MINmin2_y = 0
-	DMn_y = []
-	
-	crdnl_y = magn[-1]                # Note the Cardinal sign
-	Dd_y = float(magn[:-2])           # Just the figures, please
-	DEG_y = int(Dd_y)                   # Keep the "floor"
-	MINmin2_y = round((Dd_y - DEG_y) * 60, 2) # Get decimal Minutes
-	
-	MINminFull_y = round((Dd_y - DEG_y) * 60, 6)
-	DMm_y = DEG_y, MINminFull_y, crdnl_y 
-	
-	return DMm_y
-
-
-
 def typeCode2text(tc):
 	''' Translates the Ship type code to it's text representation
 	'''
@@ -485,328 +805,308 @@ def typeCode2text(tc):
 
 
 
-def getMonth(M):
-	if M == 1:
-		M = 'Jan'
-	elif M == 2:
-		M = 'Feb'
-	elif M == 3:
-		M = 'Mar'
-	elif M == 4:
-		M = 'Apr'
-	elif M == 5:
-		M = 'May'
-	elif M == 6:
-		M = 'Jun'
-	elif M == 7:
-		M = 'Jul'
-	elif M == 8:
-		M = 'Aug'
-	elif M == 9:
-		M = 'Sep'
-	elif M == 10:
-		M = 'Oct'
-	elif M == 11:
-		M = 'Nov'
-	elif M == 12:
-		M = 'Dec'
-	else:
-		M = 'N/A'
-	return M
+def origoDegrees(origo, offset=(0, 0)):
+	''' Converts an own-ship position, given like myPosGPS as 
+	(latitude, 'N'/'S', longitude, 'E'/'W'), to signed decimal degrees.
 	
+	Returns latitude and longitude, less the simulation offset.
+	'''
 
-def getDay(D):
-	if D == 0:
-		D = 'N/A'
-
-	return D
+	oriLa = float(origo[0])
+	if origo[1] == 'S':
+		oriLa = -oriLa
+	oriLo = float(origo[2])
+	if origo[3] == 'W':
+		oriLo = -oriLo
+# Offsetting live gps coords for debugging/simulation purposes:		
+	return oriLa - float(offset[0]), oriLo - float(offset[1])
 
-def get24h(H):
-	if H == 24:
-		H = 'N/A'
-	else:
-		H = '%0*d' % (2, H) ##################
-	return H
 
-def get60min(M):
-	if M == 60:
-		M = 'N/A'
-	else:
-		M = '%0*d' % (2, M) #################
-	return M
+class OwnShip(object):
+	''' Own ship, as the origin of the targets' ranges, bearings and XY
+	relations, with its own trigonometry worked out once per fix (see 
+	fix()) rather than once per target. 
 	
+	target() locates one target (the fast path, as records are decoded),
+	fleet() a whole TargetTable's worth at once, with NumPy.
+	'''
 
-def CommonNavigationBlock():
-	'''Parses and interprets the information payload contained  
-	in message types 1, 2 and 3.
+	nmf = 3440.065  # Nautical miles factor
+
+	def __init__(self):
+		self.origin = None
+		self.refixed = None   # Where the whole fleet was last located from
+
+	def fix(self, origin):
+		''' Takes own ship's position, as (lat, lon) in decimal degrees.'''
+		if origin != self.origin:
+			self.origin = origin
+			self.latRad = radians(origin[0])
+			self.lonRad = radians(origin[1])
+			self.cosLat = cos(self.latRad)   # Also the x-axis scale, for plotting
+
+	def target(self, tarLa, tarLo):
+		''' Locates a target, in decimal degrees, by the Haversine formula
+		(http://en.wikipedia.org/wiki/Haversine_formula).
+		
+		Returns the range (nm), the bearing, and the target's relative
+		(deltaX, deltaY) coordinates, in equilateral XY-space, packed 
+		mainly for the sprite-blitting.
+		'''
+		latRad = radians(tarLa)
+		dLat = latRad - self.latRad
+		dLon = radians(tarLo) - self.lonRad
+		a = sin(dLat/2)**2 + self.cosLat * cos(latRad) * sin(dLon/2)**2
+		xy = (self.cosLat * (tarLo - self.origin[1]), tarLa - self.origin[0])
+		bearing = degrees(atan2(xy[0], xy[1]))
+		if bearing < 0:
+			bearing += 360
+		return self.nmf * 2 * atan2(sqrt(a), sqrt(1 - a)), int(round(bearing)), xy
+
+	def fleet(self, lat, lon):
+		''' Locates targets as target() does, given NumPy arrays of their 
+		latitudes and longitudes. Returns arrays of the ranges, bearings,
+		and deltaX and deltaY coordinates.
+		'''
+		latRad = numpy.radians(lat)
+		dLat = latRad - self.latRad
+		dLon = numpy.radians(lon) - self.lonRad
+		a = numpy.sin(dLat/2)**2 + self.cosLat * numpy.cos(latRad) * numpy.sin(dLon/2)**2
+		x = self.cosLat * (lon - self.origin[1])
+		y = lat - self.origin[0]
+		bearing = numpy.degrees(numpy.arctan2(x, y))
+		with numpy.errstate(invalid='ignore'):   # NaN, for no position
+			bearing = numpy.rint(numpy.where(bearing < 0, bearing + 360, bearing))
+		return self.nmf * 2 * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1 - a)), bearing, x, y
+
+	def moved(self, threshold):
+		''' Tells if own ship is threshold nm or more off where the fleet
+		was last located from; if so, that is then here.
+		'''
+		if self.refixed is not None and self.target(*self.refixed)[0] < threshold:
+			return False
+		self.refixed = self.origin
+		return True
+
+
+class TargetRecord(object):
+	''' A decoded record, or a target's "shipfile" of all its records 
+	merged (see update()). Holds the fields of keyList1, keyList4 and 
+	keyList5 as native numbers (and text, for names and such), a field
+	not heard of being None. A field that was sent as "not available" 
+	holds its notAvailable value; see available(). (Positions out of 
+	bounds are flagged in k0_TRUBBEL, by coordCheck().)
+	
+	Reads like a dict of the fields heard of, e.g. record['k1_SOG'], 
+	'k1_SOG' in record, for field in record. The formatting for the 
+	census is left to censusLine(), the result of which is cached in 
+	census until the record is updated.
 	'''
-	
-	global _04_NavStatus
-	global lastWord
-	global popuTuple
-	global oXY_ratio
-	global spurio
-	
-	
-# Chop up the message by data fields. 
-# Then join the bitty sentence lists into proper bitstrings
-	_01_MessageID = str2Bitstr(payLoad[:6])        # 6        uint
-	_02_RepeatIndicator = str2Bitstr(payLoad[6:8]) # 2        uint
-	_03_MMSI = str2Bitstr(payLoad[8:38])           # 30       uint
-	_04_NavStatus = str2Bitstr(payLoad[38:42])     # 4        uint
-	_05_ROT = str2Bitstr(payLoad[42:50])           # 8  int Signed!
-	_06_SOG = str2Bitstr(payLoad[50:60])           # 10    udecimal
-	_07_PositionAccuracy = str2Bitstr(payLoad[61]) # 1         uint
-	_08_longitude = str2Bitstr(payLoad[61:89])     # 28 decimal Signed
-	_09_latitude = str2Bitstr(payLoad[89:116])     # 27 decimal Signed
-	_10_COG = str2Bitstr(payLoad[116:128])         # 12    udecimal
-	_11_TrueHeading = str2Bitstr(payLoad[128:137]) # 9        uint
-	_12_TimeStamp = str2Bitstr(payLoad[137:143])   # 6        uint
-	_13_REST = payLoad[143:]                # Drop these bits for now!
 
+	fields = ('k0_SYSTEMCLOCK', 'k0_SECONDS', 'k0_MMSI', 'k0_TRUBBEL',
+		'k1_NAVSTATUS', 'k1_ROT', 'k1_SOG', 'k1_LAT_Dd', 'k1_LON_Dd', 
+		'k1_RANGE', 'k1_BEARING', 'k1_XYRELATION', 'k1_COG', 'k1_HDG', 
+		'k1_TIMESTAMP', 'k5_IMO', 'k5_CALLSIGN', 'k5_NAME', 'k5_TYPE', 
+		'k5_LOA', 'k5_BEAM', 'k5_ETA_Mo', 'k5_ETA_Dy', 'k5_ETA_Hr', 
+		'k5_ETA_Mi', 'k5_DESTINAT')
+	__slots__ = fields + ('census',)
+	notAvailable = {'k1_NAVSTATUS' : 15, 'k1_ROT' : -128, 'k1_SOG' : 102.3, 
+		'k1_COG' : 360.0, 'k1_HDG' : 511, 'k1_TIMESTAMP' : 60, 'k5_IMO' : 0, 
+		'k5_TYPE' : 0, 'k5_LOA' : 0, 'k5_BEAM' : 0, 'k5_ETA_Mo' : 0, 
+		'k5_ETA_Dy' : 0, 'k5_ETA_Hr' : 24, 'k5_ETA_Mi' : 60}
+
+	def __init__(self, items=()):
+		self.census = None
+		for field, value in items:
+			setattr(self, field, value)
+
+	def __getitem__(self, field):
+		value = getattr(self, field, None)
+		if value is None:
+			raise KeyError(field)
+		return value
+
+	def __setitem__(self, field, value):
+		setattr(self, field, value)
+
+	def __contains__(self, field):
+		return getattr(self, field, None) is not None
+
+	def __iter__(self):
+		for field in self.fields:
+			if getattr(self, field, None) is not None:
+				yield field
+
+	def __eq__(self, other):
+		return isinstance(other, TargetRecord) and self.items() == other.items()
+
+	def __ne__(self, other):
+		return not self == other
+
+	__hash__ = None   # Mutable, like a dict
+
+	def __getstate__(self):
+		return tuple([getattr(self, field, None) for field in self.fields])
+
+	def __setstate__(self, state):
+		self.census = None
+		for field, value in zip(self.fields, state):
+			if value is not None:
+				setattr(self, field, value)
+
+	def get(self, field, default=None):
+		value = getattr(self, field, None)
+		if value is None:
+			return default
+		return value
+
+	def items(self):
+		return [(field, getattr(self, field)) for field in self]
+
+	def values(self):
+		return [getattr(self, field) for field in self]
+
+	def copy(self):
+		return TargetRecord(self.items())
+
+	def available(self, field):
+		''' Returns a field's value, or None if it's not heard of, or 
+		was sent as not available.
+		'''
+		value = getattr(self, field, None)
+		if value == self.notAvailable.get(field):
+			return None
+		return value
+
+	def update(self, record):
+		''' Merges in the fields of another record.
+		
+		Returns False if nothing but the timestamps changed, else True.
+		'''
+		changed = False
+		for field in record:
+			value = getattr(record, field)
+			if field not in clockKeys and getattr(self, field, None) != value:
+				changed = True
+			setattr(self, field, value)
+		self.census = None
+		return changed
+
+
+def CommonNavigationBlock(payload, ownShip, stamp):
+	'''Parses and interprets the information payload contained  
+	in message types 1, 2 and 3, as seen from ownShip (an OwnShip).
 	
+	Returns the target's record, stamped with stamp (clock, seconds).
+	'''
 	
+# Decode just the fields we use, by the type's compiled spec
+	fields = extractFields(payload, posReportFields)
 
 # Decode each field's data appropriately
-	oMessType = int(_01_MessageID , base=2)
-	oRepIndex = int(_02_RepeatIndicator , base=2)
-	oMMSI     = int(_03_MMSI , base=2)     #c.p. if len(_03_MMSI) <9 += ' '*(9-len(_03_MMSI)
-	oStatus   = int(_04_NavStatus , base=2)
-	oROT      = rot_2sC_Decoder( _05_ROT )
-	oSOG      = sog_cog_BinValueDecoder(_06_SOG)
-	oLati_Dd  = lat_2sC_Decoder(_09_latitude)  
-	oLati_DMm = Dd2DMm_x(lat_2sC_Decoder(_09_latitude)) # Surplus variable eventually
-	oLongi_Dd = lon_2sC_Decoder(_08_longitude)
-	oLongi_DMm= Dd2DMm_y(lon_2sC_Decoder(_08_longitude)) # Surplus variable eventually
-	oCOG      = sog_cog_BinValueDecoder(_10_COG)
-	oHDG      = int(_11_TrueHeading , base=2) 
-	oStamp    = int(_12_TimeStamp , base=2)
-	oTypKnas  = spurio
-
-# Reformat position coordinates for target range trigonometry
-	if myOrigo[1] == 'S':
-		myOrigoLati = '-' + myOrigo[0]
-	else:
-		myOrigoLati = myOrigo[0]
-	if myOrigo[3] == 'W':
-		myOrigoLongi = '-' + myOrigo[2]
-	else:
-		myOrigoLongi = myOrigo[2]
-# Offsetting live gps coords for debugging/simulation purposes:		
-	myOrigoLati =  float(myOrigoLati) - float(myOffset[0])
-	myOrigoLongi =  float(myOrigoLongi) - float(myOffset[1])
-	
-	if oLati_Dd[-1] == 'S':
-		lati_Dd = '-' + oLati_Dd[:-2]
-	else:
-		lati_Dd = oLati_Dd[:-2]
-		
-	if oLongi_Dd[-1] == 'W':
-		longi_Dd = '-' + oLongi_Dd[:-2]
-	else:
-		longi_Dd = oLongi_Dd[:-2]
-
-	oriLa	= float(myOrigoLati)
-	oriLo	= float(myOrigoLongi)
-	tarLa	= float(lati_Dd)
-	tarLo	= float(longi_Dd)
-	origo	= ((oriLa, 0, 0), (oriLo, 0, 0))
-	target	= ((tarLa, 0, 0), (tarLo, 0, 0))	
-	RnB     = rangeFinder(origo, target)
-	oRange = RnB[0]
-# Factor for plotting correct x-axis scale:	
-	oXY_ratio = cos(radians(oriLa)) 
-
-# Relative coordinates to target in equilateral XY-space
-# i.e.(deltaX, deltaY) packed mainly for the sprite-blitting:
-	oTarXY = (oXY_ratio * (tarLo - oriLo), tarLa - oriLa) 
-
-# We unpack the coords again and fork a bearing computation here:
-	oBearing =  findOurBearings(oTarXY[0], oTarXY[1])
-	
-# Zip a dict from the k- and v-lists
+	oMMSI     = fields['MMSI']     #c.p. if len(_03_MMSI) <9 += ' '*(9-len(_03_MMSI)
+	oStatus   = fields['NavStatus']
+	oROT      = fields['ROT']
+	oSOG      = fields['SOG']
+	oLati_Dd, oLongi_Dd, oTypKnas = coordCheck(fields['Latitude'], fields['Longitude'])
+	oCOG      = fields['COG']
+	oHDG      = fields['TrueHeading']
+	oStamp    = fields['TimeStamp']
+
+# Target range trigonometry
+	oRange, oBearing, oTarXY = ownShip.target(oLati_Dd, oLongi_Dd)
+	
+# Zip a record from the k- and v-lists
 	valList1 = [
-		systemClock,
-		secondsUp, 
+		stamp[0],
+		stamp[1], 
 		oMMSI, 
 		oStatus,
-		statusCode2text(oStatus), # This substitutes navstatus_legend
 		oROT, 
 		oSOG, 
 		oLati_Dd,
-		oLati_DMm,
 		oLongi_Dd,
-		oLongi_DMm,
 		oRange,
 		oBearing,
 		oTarXY,
 		oCOG,
 		oHDG,
 		oStamp,
-		oTypKnas]
+		oTypKnas]  # Error code flag, a.k.a. spurio
 		
-	lastWord = dict(zip(keyList1, valList1))
-	
-	upDatePPL()
-	popuWrite(popuList)
+	return TargetRecord(zip(keyList1, valList1))
 
 
 
-def BaseStationReport():
+def BaseStationReport(payload, ownShip, stamp):
 	'''Parses and interprets the information payload contained  
-	in message type 4 Base Station Report.
-	'''
-	global lastWord
-	global popuTuple
-	global oXY_ratio
-	global spurio
-
-	_401_MessageID = str2Bitstr(payLoad[:6])
-	_402_RepeatIndicator = str2Bitstr(payLoad[6:8]) 
-	_403_MMSI = str2Bitstr(payLoad[8:38])
-	_41_Yr = str2Bitstr(payLoad[38:52])
-	_42_Mo = str2Bitstr(payLoad[52:56])
-	_43_Day = str2Bitstr(payLoad[56:61])
-	_44_Hr = str2Bitstr(payLoad[61:66])
-	_45_Min = str2Bitstr(payLoad[66:72]) 
-	_46_Sec = str2Bitstr(payLoad[72:78])
-	_408_longitude = str2Bitstr(payLoad[79:107])
-	_409_latitude = str2Bitstr(payLoad[107:134])
-	
-	oMessType = int(_401_MessageID , base=2)
-	oMMSI     = int(_403_MMSI , base=2)
+	in message type 4 Base Station Report, as seen from ownShip (an OwnShip).
+	
+	Returns the station's record, stamped with stamp (clock, seconds).
+	'''
+
+	fields = extractFields(payload, baseReportFields)
+	
+	oMMSI     = fields['MMSI']
 #	oYr       =			    # UTC, 1-999, 0 = N/A (default)
 #	oMo       =
 #	oDay      =
 #	oHr       =
 #	oMin      =
 #	oSec      =			    # 0-59, 60=N/A
-	oLati_Dd  = lat_2sC_Decoder(_409_latitude)  
-	oLati_DMm = Dd2DMm_x(lat_2sC_Decoder(_409_latitude)) # Surplus variable eventually
-	oLongi_Dd = lon_2sC_Decoder(_408_longitude)
-	oLongi_DMm= Dd2DMm_y(lon_2sC_Decoder(_408_longitude)) # Surplus variable eventually
+	oLati_Dd, oLongi_Dd, oTypKnas = coordCheck(fields['Latitude'], fields['Longitude'])
 	oName     = 'Base Stn ' + str(oMMSI)
-	oTypKnas  = spurio
 	
-# Reformat position coordinates for target range trigonometry
-	if myOrigo[1] == 'S':
-		myOrigoLati = '-' + myOrigo[0]
-	else:
-		myOrigoLati = myOrigo[0]		
-	if myOrigo[3] == 'W':
-		myOrigoLongi = '-' + myOrigo[2]
-	else:
-		myOrigoLongi = myOrigo[2]
-# Offsetting live gps coords for debugging/simulation purposes:		
-	myOrigoLati =  float(myOrigoLati) - float(myOffset[0])
-	myOrigoLongi =  float(myOrigoLongi) - float(myOffset[1])
+# Target range trigonometry
+	oRange, oBearing, oTarXY = ownShip.target(oLati_Dd, oLongi_Dd)
 	
-	if oLati_Dd[-1] == 'S':
-		lati_Dd = '-' + oLati_Dd[:-2]
-	else:
-		lati_Dd = oLati_Dd[:-2]	
-	if oLongi_Dd[-1] == 'W':
-		longi_Dd = '-' + oLongi_Dd[:-2]
-	else:
-		longi_Dd = oLongi_Dd[:-2]
-
-	oriLa	= float(myOrigoLati)
-	oriLo	= float(myOrigoLongi)
-	tarLa	= float(lati_Dd)
-	tarLo	= float(longi_Dd)
-	origo	= ((oriLa, 0, 0), (oriLo, 0, 0))
-	target	= ((tarLa, 0, 0), (tarLo, 0, 0))	
-	RnB     = rangeFinder(origo, target)
-	oRange = RnB[0]
-# Factor for plotting correct x-axis scale:	
-	oXY_ratio = cos(radians(oriLa)) 
-# Relative coordinates to target in equilateral XY-space
-# i.e.(deltaX, deltaY) packed mainly for the sprite-blitting:
-	oTarXY = (oXY_ratio * (tarLo - oriLo), tarLa - oriLa) 
-# We unpack the coords again and fork a bearing computation here:
-	oBearing =  findOurBearings(oTarXY[0], oTarXY[1])
-	
-
-# Zip a dict from the k- and v-lists
+
+# Zip a record from the k- and v-lists
 	valList4 = [
-		systemClock,
-		secondsUp, 
+		stamp[0],
+		stamp[1], 
 		oMMSI, 
 		oName,
 		oLati_Dd,
-		oLati_DMm,
 		oLongi_Dd,
-		oLongi_DMm,
 		oRange,
 		oBearing,
 		oTarXY,
-		oTypKnas]
+		oTypKnas]  # Error code flag, a.k.a. spurio
 
-	lastWord = dict(zip(keyList4, valList4))
-	
-	upDatePPL()
-	popuWrite(popuList)
+	return TargetRecord(zip(keyList4, valList4))
 
 
-def ShipTripData():
+def ShipTripData(payload, ownShip, stamp):
 	'''Parses and interprets the information payload contained  
-	in message type 5 (a multi-fragment sentence).
-	'''
-	
-	global stashedPart
-	global lastWord
-	global popuTuple 
-	
-	multipLoad = stashedPart + payLoad
-	
-# Chop up the message by data fields. 
-# Then join the bitty sentence lists into proper bitstrings.
-	_501_MessageID = str2Bitstr(multipLoad [:6])      
-	_502_RepeatIndicator = str2Bitstr(multipLoad [6:8]) 
-	_503_MMSI = str2Bitstr(multipLoad [8:38])        
-	_51_IMOnr = str2Bitstr(multipLoad [40:70])
-	_52_CallSign = str2Bitstr(multipLoad [70:112])
-	_53_ShipName = str2Bitstr(multipLoad [112:232])
-	_54_ShipType = str2Bitstr(multipLoad [232:240])
-	_55_DimBow = str2Bitstr(multipLoad [240:249])
-	_55_DimStern = str2Bitstr(multipLoad [249:258])
-	_56_DimPort = str2Bitstr(multipLoad [258:264])
-	_56_DimStarb = str2Bitstr(multipLoad [264:270])
-	_57_ETAmo = str2Bitstr(multipLoad [274:278])
-	_57_ETAday = str2Bitstr(multipLoad [278:283])
-	_57_ETAh = str2Bitstr(multipLoad [283:288])
-	_57_ETAmin = str2Bitstr(multipLoad [288:294])
-	_58_Destination = str2Bitstr(multipLoad [302:422])
+	in message type 5 (a multi-fragment sentence, as reassembled).
 	
+	Returns the vessel's record, stamped with stamp (clock, seconds).
+	'''
 	
+# Decode just the fields we use, by the type's compiled spec
+	fields = extractFields(payload, tripDataFields)
 	
 # Decode each field's data appropriately
-	oMessType = int(_501_MessageID , base=2)
-	oMMSI     = int(_503_MMSI , base=2) #c.p. if len(_03_MMSI) <9 += ' '*(9-len(_03_MMSI)
-	oIMO      = int(_51_IMOnr , base=2)
-	oCallOut  = str.rstrip(sixBit2ICAO(_52_CallSign))	# 7 six-bits chars
-	oCallSign = str.rstrip(sixBit2ASCIIchar(_52_CallSign))
-	oName     = str.rstrip(sixBit2ASCIIchar(_53_ShipName))    # 20 six-bits chars
-	oType     = typeCode2text(int(_54_ShipType , base=2)) # 0-99
-	oBow      = int(_55_DimBow , base=2)
-	oStern    = int(_55_DimStern , base=2)  
-	oLOA      = oBow + oStern
-	oPort     = int(_56_DimPort , base=2)
-	oStarb    = int(_56_DimStarb , base=2)
-	oBeam     = oPort + oStarb
-	oETAmo    = getMonth(int(_57_ETAmo, base=2))   # 1-12, 0=N/A
-	oETAday   = getDay(int(_57_ETAday, base=2))    # 1-31, 0=N/A
-	oETAh     = get24h(int(_57_ETAh, base=2))      # 0-23, 24=N/A
-	oETAmin   = get60min(int(_57_ETAmin, base=2))  # 0-59, 60=N/A
-	oDest     = sixBit2ASCIIchar(_58_Destination)   # 20 six-bits chars
-
-# Zip a dict from the k- and v-lists
+	oMMSI     = fields['MMSI'] #c.p. if len(_03_MMSI) <9 += ' '*(9-len(_03_MMSI)
+	oIMO      = fields['IMO']
+	oCallSign = fields['CallSign']	# 7 six-bits chars
+	oName     = fields['ShipName']    # 20 six-bits chars
+	oType     = fields['ShipType'] # 0-99
+	oLOA      = fields['DimBow'] + fields['DimStern']
+	oBeam     = fields['DimPort'] + fields['DimStarboard']
+	oETAmo    = fields['ETAMonth']   # 1-12, 0=N/A
+	oETAday   = fields['ETADay']    # 1-31, 0=N/A
+	oETAh     = fields['ETAHour']      # 0-23, 24=N/A
+	oETAmin   = fields['ETAMinute']  # 0-59, 60=N/A
+	oDest     = fields['Destination']   # 20 six-bits chars
+
+# Zip a record from the k- and v-lists
 	valList5 = [
-		systemClock,
-		secondsUp,
+		stamp[0],
+		stamp[1],
 		oMMSI,  
 		oIMO,
-		oCallOut,
 		oCallSign,
 		oName,
 		oType,
@@ -818,10 +1118,108 @@ def ShipTripData():
 		oETAmin,
 		oDest,]
 		
-	lastWord = dict(zip(keyList5, valList5))
+	return TargetRecord(zip(keyList5, valList5))
+
+
+def clockStamp(now):
+	''' Returns the local time of day now (a time.time() value) as the
+	clock string and seconds since midnight we stamp records with.
+	'''
+
+	systemClock = time.strftime('%H:%M:%S',time.localtime(now))
+	secondsUp = 3600*int(systemClock[:2])+60*int(systemClock[3:5])+int(systemClock[6:])
+	return systemClock, secondsUp
+
+
+def monoClock():
+	''' Returns the seconds passed since some fixed point in the past:
+	a clock that, unlike time.time() or the seconds since midnight, 
+	never jumps or turns back.
+	'''
+
+	return os.times()[4]
+
+
+class AISDecoder(object):
+	''' Decodes AIVDM sentences into target records, i.e. TargetRecords 
+	of the fields of keyList1, keyList4 or keyList5, one sentence at a time.
 	
-	upDatePPL()
-	popuWrite(popuList)
+	A decoder owns all its state: multipart messages in flight, 
+	recently heard sentences, the type 5 data of known vessels, and own
+	ship (an OwnShip). So any number of them may run side by side, 
+	sharing nothing but the read-only tables. handlers maps the message
+	types to decode to functions taking (payload, ownShip, stamp), 
+	ownShip being the OwnShip fixed at own ship's position; offset is 
+	subtracted from own ship's position, for simulations.
+	'''
+
+	def __init__(self, handlers=None, offset=(0, 0), maxVessels=500):
+		if handlers is None:
+			handlers = msgHandlers
+		self.handlers = handlers
+		self.offset = offset
+		self.wantedChars = typeChars(handlers)
+		self.reassembler = Reassembler()     # Multipart messages in flight
+		self.dupeFilter = DupeFilter()       # Sentences heard in the last few seconds
+		self.voyageCache = VoyageCache(maxVessels)  # Last type 5 data per vessel
+		self.ownShip = OwnShip()   # Where the targets are located from
+
+	def decode(self, sentence, origo, now=None):
+		''' Takes one NMEA sentence, and own ship's position like 
+		myPosGPS, or a function returning it (only called when needed).
+		
+		Returns a list of the records decoded: none unless the sentence 
+		completes a new message of a type we handle. Raises ValueError 
+		for a sentence that is garbled or fails its checksum.
+		'''
+		if now is None:
+			now = time.time()
+		data, cksum, calc_cksum = checkSumCheck(sentence)
+		if cksum != calc_cksum:
+			raise ValueError('Error in checksum for: %s' % (data))
+		payload = self.reassemble(sentence, now, data)
+		if payload is None:
+			return []
+		return self.decodeMessage(payload, origo, now)
+
+	def reassemble(self, sentence, now, data=None):
+		''' Takes a sentence that checks out, and its nmea data (if at
+		hand). Returns the payload of the message it completes, if any,
+		else None: for copies, types we don't handle, and fragments.
+		'''
+		if data is None:
+			data = sentence[sentence.find('!') + 1:sentence.find('*')]
+		if self.dupeFilter.seen(dupeKey(data), now):   # Heard that already: drop the copy
+			return None
+		if not wantedSentence(sentence, self.wantedChars, self.reassembler):
+			return None    # Not a type of ours: skip it unread
+		partsCount, partNumber, sequentID, channel, payload = decapsulate(sentence)
+		if partsCount != '1':  # Hold on to fragments until the message is whole
+			payload = self.reassembler.add(int(partsCount), int(partNumber), 
+				sequentID, channel, payload, now)
+		return payload
+
+	def decodeMessage(self, payload, origo, now):
+		''' Decodes a complete message payload, as decode() does.'''
+		msgId = payload.get_uint(0, 6)
+		if msgId not in self.handlers:
+			return []    # No significance to us, so just ignore it...
+		stamp = clockStamp(now)
+		if msgId == 5:   # Unchanged repeats are taken from the cache
+			mmsi = payload.get_uint(8, 30)
+			record = self.voyageCache.lookup(mmsi, payload)
+			if record is not None:
+				record = record.copy()
+				record['k0_SYSTEMCLOCK'], record['k0_SECONDS'] = stamp
+				return [record]
+		if callable(origo):
+			origo = origo()
+		self.ownShip.fix(origoDegrees(origo, self.offset))
+		record = self.handlers[msgId](payload, self.ownShip, stamp)
+		if msgId == 5:
+			self.voyageCache.store(mmsi, payload, record.copy())   # Not the one filed as a shipfile
+		return [record]
+
 
 	
 def fPrint(nr):
@@ -831,169 +1229,374 @@ def fPrint(nr):
 	except 1 to 5)
 	'''
 	global ticker
-	global idBits
 	
 	if nr == 1:
 		print '\n_____________ Nummer ', ticker,'_____________'
-	if nr == 2:
-		print '\n::::::::::::::::::::::'
-		print 'This message type (',idBits,') is not implemented yet! '
-		print   '::::::::::::::::::::::'
-	if nr == 3:
-		print '\n This is a type ',idBits,' message with partsCount > 2 !'
-		print 'Can\'t handle those, can we.'
-	if nr == 4:
-		print '\n::::::::::::::::::::::'
-		print 'Here we ignore a two-part message of type',idBits,'.'
-		print 'Jumping one tick...'
-		print '::::::::::::::::::::::'
 		
 
 
-def recalculate_coordinate(val,  as_= None):
-	'''
-	Accepts a coordinate as a tuple (degree, minutes, seconds). 
-	You can give only one of them (e.g. only minutes as a floating
-	point number) and it will be duly recalculated into degrees,
-	minutes and seconds.
-	Return value can be specified as 'deg', 'min' or 'sec'; 
-	default return value is a proper coordinate tuple.
-	'''
-	
-	deg,  min,  sec = val
-	# pass outstanding values from right to left
-	min = (min or 0) + int(sec) / 60
-	sec = sec % 60
-	deg = (deg or 0) + int(min) / 60
-	min = min % 60
-	# pass decimal part from left to right
-	dfrac,  dint = modf(deg)
-	min = min + dfrac * 60
-	deg = dint
-	mfrac,  mint = modf(min)
-	sec = sec + mfrac * 60
-	min = mint
-	if as_:
-		sec = sec + min * 60 + deg * 3600
-		if as_ == 'sec': return sec
-		if as_ == 'min': return sec / 60
-		if as_ == 'deg': return sec / 3600
-	return deg,  min,  sec
-
-
-def rangeFinder(here, thar):
-	'''
-	Calculate distance (in nautical miles) between two points 
-	given as (lat, long) pairs based on the Haversine formula 
-	(http://en.wikipedia.org/wiki/Haversine_formula). 
-	Implementation inspired by JavaScript implementation from 
-	http://www.movable-type.co.uk/scripts/latlong.html. Accepts 
-	coordinates as tuples (deg, min, sec), but coords can be given
-	in any form - e.g. specified in minutes: (0, 3133.9333, 0)
-	is interpreted as (52.0, 13.0, 55.998000000008687).
+class TargetStore(object):
+	''' The targets, i e their "shipfile" TargetRecords, by MMSI, in the order
+	they were heard in: the one heard last comes last. Iterate over it
+	for the shipfiles, oldest first.
+	
+	Lookups, updates and moving a target to the end are all O(1).
+	
+	A target not heard from for its time to live (vesselTTL, or 
+	baseStationTTL) is due to go, by the monotonic clock (monoClock());
+	expire() removes those. They're found with a heap of (deadline, 
+	MMSI), holding one entry per target: an update just moves the 
+	target's deadline on, and an entry found to be early when it comes 
+	up is put back in at the deadline. The stale entries of removed 
+	targets are skipped when they come up, or dropped all at once when
+	they outnumber the live ones twice over (see compact()).
+	
+	The store is kept within a budget of maxTargets targets and 
+	maxBytes bytes (as estimated by shipfileBytes()), by evicting the 
+	least recently heard targets. bytes tells the current estimate; 
+	evicted how many targets were evicted; highTargets and highBytes 
+	the most targets and bytes held at any time (see usage()).
+	
+	Given a TargetTable, the store keeps it up to date with the targets.
 	'''
-	nmf = 3440.065  # Nautical miles factor
 
-	here_latt = radians(recalculate_coordinate(here[0],  'deg'))
-	here_long = radians(recalculate_coordinate(here[1],  'deg'))
-	thar_latt = radians(recalculate_coordinate(thar[0],  'deg'))
-	thar_long = radians(recalculate_coordinate(thar[1],  'deg'))
-	d_latt = thar_latt - here_latt
-	d_long = thar_long - here_long
-	a = sin(d_latt/2)**2 + cos(here_latt) * cos(thar_latt) * sin(d_long/2)**2
-	c = 2 * atan2(sqrt(a),  sqrt(1-a))
-	
-	return nmf * c, nmf * d_latt
-				
-
-
-def findOurBearings(deltaX, deltaY):
-	
-	x_ = abs(deltaX)
-	y_ = abs(deltaY)
-	boring = 0.0
-
-	if deltaX > 0 and deltaY >= 0:
-	# target is in quadrant I (x_+ y_+)
-	# Make sure never to divide by 0.
-		if y_ > 0 and x_ > 0:
-			aRad = atan(x_/y_)
-			aDeg = (aRad/pi)*180
-			boring = float(aDeg)
-		elif x_ == 0:
-			boring = 90.0
-		else:
-			boring = 0.0
-	
-	elif deltaX >= 0 and deltaY < 0:
-	# target is in quadrant II (x_+ y_-)
-		if y_ > 0 and x_ > 0:
-			aRad = atan(y_/x_)
-			aDeg = (aRad/pi)*180
-			boring = float(aDeg) + 90 ##
-		elif x_ == 0:
-			boring = 270.0
-		else:
-			boring = 0.0
-
-	elif deltaX < 0 and deltaY < 0:
-	# target is in quadrant III (x_- y_-)
-		if y_ > 0 and x_ > 0:
-			aRad = atan(x_/y_)
-			aDeg = (aRad/pi)*180
-			boring = float(aDeg) + 180
-		elif y_ == 0:
-			boring = 180.0
-		else:
-			boring = 270.0
-
-	else:
-	# target is in quadrant IV (x_- y_+)
-		if y_ > 0 and x_ > 0:
-			aRad = atan(y_/x_)
-			aDeg = (aRad/pi)*180
-			boring = float(aDeg) + 270 ##
-		elif x_ == 0:
-			boring = 90.0
+	def __init__(self, maxTargets=5000, maxBytes=8*1024*1024, table=None):
+		self.maxTargets = maxTargets
+		self.maxBytes = maxBytes
+		self.table = table
+		self.ownShip = OwnShip()   # Where the targets were last located from
+		self.byMMSI = OrderedDict()
+		self.deadlines = {}   # MMSI: when the target is due to go
+		self.scheduled = {}   # MMSI: the deadline of its entry in the heap
+		self.heap = []
+		self.sizes = {}   # MMSI: the bytes its shipfile takes
+		self.bytes = 0
+		self.evicted = 0
+		self.highTargets = 0
+		self.highBytes = 0
+
+	def __len__(self):
+		return len(self.byMMSI)
+
+	def __iter__(self):
+		return self.byMMSI.itervalues()
+
+	def __contains__(self, mmsi):
+		return mmsi in self.byMMSI
+
+	def get(self, mmsi):
+		return self.byMMSI.get(mmsi)
+
+	def oldest(self):
+		''' Returns the shipfile heard from least recently, or None.'''
+		for shipfile in self.byMMSI.itervalues():
+			return shipfile
+		return None
+
+	def newest(self):
+		''' Returns the shipfile heard from last, or None.'''
+		if self.byMMSI:
+			return self.byMMSI[next(reversed(self.byMMSI))]
+		return None
+
+	def update(self, lastWord, now=None):
+		''' Files a freshly decoded record with its target, which is 
+		then the one most recently heard, as of now (by monoClock()).
+		
+		Returns False if nothing but the timestamps changed, else True.
+		'''
+		if now is None:
+			now = monoClock()
+		mmsi = lastWord['k0_MMSI']
+		self.deadlines[mmsi] = now + self.timeToLive(mmsi)
+		if mmsi not in self.scheduled:
+			self.scheduled[mmsi] = self.deadlines[mmsi]
+			heapq.heappush(self.heap, (self.deadlines[mmsi], mmsi))
+		shipfile = self.byMMSI.pop(mmsi, None)
+		changed = True
+		if shipfile is not None:
+			changed = shipfile.update(lastWord)
 		else:
-			boring = 180.0 
+			shipfile = lastWord
+		self.byMMSI[mmsi] = shipfile
+		if self.table is not None:
+			self.table.update(shipfile, now)
+		size = shipfileBytes(shipfile)
+		self.bytes += size - self.sizes.get(mmsi, 0)
+		self.sizes[mmsi] = size
+		while len(self.byMMSI) > 1 and (len(self.byMMSI) > self.maxTargets 
+				or self.bytes > self.maxBytes):   # Over budget: evict the oldest
+			self.remove(next(iter(self.byMMSI)))
+			self.evicted += 1
+		self.highTargets = max(self.highTargets, len(self.byMMSI))
+		self.highBytes = max(self.highBytes, self.bytes)
+		return changed
+
+	def remove(self, mmsi):
+		''' Removes a target; returns its shipfile, or None if unknown.'''
+		self.deadlines.pop(mmsi, None)
+		self.scheduled.pop(mmsi, None)   # Leaves a stale entry in the heap
+		if len(self.heap) > 3 * len(self.scheduled):
+			self.compact()
+		self.bytes -= self.sizes.pop(mmsi, 0)
+		if self.table is not None:
+			self.table.remove(mmsi)
+		return self.byMMSI.pop(mmsi, None)
+
+	def compact(self):
+		''' Rebuilds the heap from the live targets' entries, dropping
+		the stale ones.
+		'''
+		self.heap = [(deadline, mmsi) for mmsi, deadline in self.scheduled.iteritems()]
+		heapq.heapify(self.heap)
+
+	def clear(self):
+		self.byMMSI.clear()
+		self.deadlines.clear()
+		self.scheduled.clear()
+		del self.heap[:]
+		self.sizes.clear()
+		self.bytes = 0
+		if self.table is not None:
+			self.table.clear()
+
+	def usage(self):
+		''' Returns a line telling the targets and bytes held, now and
+		at the most, against the budget, and the evictions.
+		'''
+		return '%d targets (at most %d, of %d), %d bytes (at most %d, of %d), %d evicted' % (
+			len(self.byMMSI), self.highTargets, self.maxTargets, 
+			self.bytes, self.highBytes, self.maxBytes, self.evicted)
+
+	def timeToLive(self, mmsi):
+		''' Returns the seconds a target is kept without a word from it.
+		Base stations have MMSIs 00MIDxxxx, i e below 10000000.
+		'''
+		if mmsi < 10000000:
+			return baseStationTTL
+		return vesselTTL
+
+	def expire(self, now=None):
+		''' Removes the targets due to go by now (by monoClock()). 
+		Returns a list of their shipfiles.
+		'''
+		if now is None:
+			now = monoClock()
+		expired = []
+		while self.heap and self.heap[0][0] <= now:
+			deadline, mmsi = heapq.heappop(self.heap)
+			if self.scheduled.get(mmsi) != deadline:
+				continue   # Stale: the target was removed
+			if self.deadlines[mmsi] > now:   # Heard from since: put it back
+				self.scheduled[mmsi] = self.deadlines[mmsi]
+				heapq.heappush(self.heap, (self.deadlines[mmsi], mmsi))
+			else:
+				expired.append(self.remove(mmsi))
+		return expired
+
+	def refix(self, origin):
+		''' Locates all targets anew from origin, own ship's position in
+		decimal degrees, if it's fleetRefix nm or more off where they 
+		were last located from. With a TargetTable, that's done for the 
+		whole fleet at once.
 		
-	return str(int(round(boring)))
+		Returns True if the targets were located anew, else False.
+		'''
+		ownShip = self.ownShip
+		ownShip.fix(origin)
+		if not ownShip.moved(fleetRefix):
+			return False
+		if self.table is not None:
+			data = self.table.data
+			ranges, bearings, xs, ys = ownShip.fleet(data['lat'], data['lon'])
+			data['range'], data['bearing'], data['x'], data['y'] = ranges, bearings, xs, ys
+			for mmsi, row in self.table.rows.iteritems():
+				if not numpy.isnan(ranges[row]):   # It has a position
+					shipfile = self.byMMSI[mmsi]
+					shipfile.k1_RANGE = float(ranges[row])
+					shipfile.k1_BEARING = int(bearings[row])
+					shipfile.k1_XYRELATION = (float(xs[row]), float(ys[row]))
+					shipfile.census = None
+			return True
+		for shipfile in self.byMMSI.itervalues():
+			if 'k1_LAT_Dd' in shipfile and shipfile.get('k0_TRUBBEL') == 'ok':
+				shipfile.k1_RANGE, shipfile.k1_BEARING, shipfile.k1_XYRELATION = \
+					ownShip.target(shipfile.k1_LAT_Dd, shipfile.k1_LON_Dd)
+				shipfile.census = None
+		return True
+
+
+class TargetTable(object):
+	''' The targets' numbers, column by column: a NumPy structured 
+	array of targetColumns, one row per target, for working on the
+	whole fleet at once (ranges, sorting, filtering, plotting). A number
+	not available is NaN.
+	
+	rows maps MMSIs to rows. The rows of targets removed go to the free
+	list, to be reused; when there are none left, the array doubles.
+	'''
+
+	def __init__(self, capacity=256):
+		self.data = numpy.zeros(capacity, targetColumns)
+		self.rows = {}   # MMSI: its row
+		self.free = list(range(capacity - 1, -1, -1))   # Lowest row last, taken first
+
+	def __len__(self):
+		return len(self.rows)
+
+	def update(self, shipfile, seen):
+		''' Fills in the row of a shipfile's target, heard at seen.'''
+		mmsi = shipfile['k0_MMSI']
+		row = self.rows.get(mmsi)
+		if row is None:
+			if not self.free:
+				self.grow()
+			row = self.free.pop()
+			self.rows[mmsi] = row
+			flags = rowInUse
+			if mmsi < 10000000:   # 00MIDxxxx
+				flags |= rowBaseStation
+			self.data[row] = (mmsi, numpy.nan, numpy.nan, numpy.nan, numpy.nan, 
+				numpy.nan, numpy.nan, numpy.nan, numpy.nan, numpy.nan, seen, flags)
+		data = self.data
+		data['seen'][row] = seen
+		if shipfile.get('k0_TRUBBEL', 'ok') != 'ok':   # Goofy position
+			data['flags'][row] = int(data['flags'][row]) | rowGoofy
+			data['lat'][row] = data['lon'][row] = numpy.nan
+			data['range'][row] = data['bearing'][row] = numpy.nan
+			data['x'][row] = data['y'][row] = numpy.nan
+		elif 'k1_LAT_Dd' in shipfile:
+			data['flags'][row] = int(data['flags'][row]) & ~rowGoofy
+			data['lat'][row] = shipfile['k1_LAT_Dd']
+			data['lon'][row] = shipfile['k1_LON_Dd']
+			data['range'][row] = shipfile['k1_RANGE']
+			data['bearing'][row] = shipfile['k1_BEARING']
+			data['x'][row], data['y'][row] = shipfile['k1_XYRELATION']
+		data['sog'][row] = tableNumber(shipfile.available('k1_SOG'))
+		data['cog'][row] = tableNumber(shipfile.available('k1_COG'))
+		data['heading'][row] = tableNumber(shipfile.available('k1_HDG'))
+		return row
+
+	def remove(self, mmsi):
+		row = self.rows.pop(mmsi, None)
+		if row is not None:
+			self.data['flags'][row] = 0
+			self.free.append(row)
+
+	def clear(self):
+		self.data['flags'] = 0
+		self.rows.clear()
+		self.free = list(range(len(self.data) - 1, -1, -1))
+
+	def grow(self):
+		''' Doubles the array, the new rows going to the free list.'''
+		capacity = len(self.data)
+		self.data = numpy.concatenate((self.data, numpy.zeros(capacity, targetColumns)))
+		self.free.extend(range(2*capacity - 1, capacity - 1, -1))
+
+	def live(self):
+		''' Returns a copy of the rows in use.'''
+		return self.data[self.data['flags'] & rowInUse != 0]
+
+
+def tableNumber(value):
+	''' Returns a shipfile's value, as by TargetRecord.available(), for
+	a TargetTable: NaN if it's None.
+	'''
 
-def upDatePPL():
-	global popuList
-	global lastWord
+	if value is None:
+		return numpy.nan
+	return value
 
-	newMMSI = lastWord['k0_MMSI']
 
-	pointer = search(popuList, newMMSI)
+def shipfileBytes(shipfile):
+	''' Estimates the bytes a shipfile takes: the record and its values.
+	'''
+
+	size = sys.getsizeof(shipfile)
+	for value in shipfile.values():
+		size += sys.getsizeof(value)
+		if isinstance(value, tuple):
+			size += sum([sys.getsizeof(item) for item in value])
+	return size
+
+
+def upDatePPL(lastWord):
+	''' Files a freshly decoded record with its target in popuStore, 
+	which is then the one most recently heard.
 	
-	if pointer != 1000:
-		for field in lastWord:
-			popuList[pointer][field]=lastWord[field]
-		popuList.append(popuList[pointer])
-		del popuList[pointer]
+	Returns False if nothing but the timestamps changed, else True.
+	'''
+	return popuStore.update(lastWord)
+
+def censusLine(shipfile):
+	''' Formats a shipfile's line in the census, i.e. the presentation 
+	of its numbers as PloyPlotter reads them: '' for a target that 
+	still lacks a position.
+	'''
+
+	if 'k1_LAT_Dd' not in shipfile:
+	# This diverts targets that lack LAT, LON, SOG, COG, HDG, ROT, etc, pending
+	# their presumed completion. Now, if the session's first dict from popuStore
+	# contains only mess-type 5 data, i.e. has no 'k1_LAT_Dd' key etc, the 
+	# resulting empty list of the census-file will crash PloyPlotter.
+	# Update: We seem to have solved this more-or-less by some ungraceful 
+	# exception juggling in PloyPlot's while-loop.
+		return ''
+	line = [str(shipfile['k0_MMSI']) + ',']	# 0
+	line.append(shipfile.get('k5_NAME', '') + ',')	# 1
+	if 'k5_CALLSIGN' in shipfile:
+		line.append(sixBit2ICAO(shipfile['k5_CALLSIGN']) + ',')	# 2
+		line.append(shipfile['k5_CALLSIGN'] + ',')	# 3
 	else:
-		popuList.append(lastWord)		
-	del lastWord
-
-def search(db, val, k0 ='k0_MMSI'):
-	for i in range(len(db)):
-		if db[i].has_key(k0):
-			if val == db[i][k0]:
-				break	
-			else:
-				i = 1000
-		else:
-			pass
-	return i
-		
+		line.append(',,')
+	if 'k1_NAVSTATUS' in shipfile:
+		line.append(statusCode2text(shipfile['k1_NAVSTATUS']) + ',')	# 4 This substitutes navstatus_legend
+	else:
+		line.append(',')
+	if 'k5_TYPE' in shipfile:
+		line.append(typeCode2text(shipfile['k5_TYPE']) + ',')	# 5
+	else:
+		line.append(',')
+	line.append(str(shipfile.get('k5_LOA', '')) + ',')	# 6
+	line.append(str(shipfile.get('k5_BEAM', '')) + ',')	# 7
+	if 'k1_SOG' in shipfile:
+		line.append(sog_cog_BinValueDecoder(shipfile['k1_SOG']) + ',')	# 8
+	else:
+		line.append(',')
+	if 'k1_COG' in shipfile:
+		line.append(sog_cog_BinValueDecoder(shipfile['k1_COG']) + ',')	# 9
+	else:
+		line.append('360,')	# Just to prevent hiccups in the plotter
+	line.append(str(shipfile.get('k1_HDG', '')) + ',')	#10
+	if 'k1_ROT' in shipfile:
+		line.append(rot_2sC_Decoder(shipfile['k1_ROT']) + ',')	#11
+	else:
+		line.append(',')
+	line.append(coord2text(shipfile['k1_LAT_Dd'], 'N', 'S') + ',')	#12
+	line.append(coord2text(shipfile['k1_LON_Dd'], 'E', 'W') + ',')	#13
+	if 'k1_RANGE' in shipfile:  # How do you like this little gem?: 
+		line.append(str(Decimal(str(round(shipfile['k1_RANGE'],2))).quantize(Decimal('0.01'))) + ',')	#14
+	else:
+		line.append(',')
+	line.append(str(shipfile.get('k1_BEARING', '')) + ',')	#15
+	if 'k1_XYRELATION' in shipfile:
+		line.append(str(shipfile['k1_XYRELATION'][0]) + ',')   #16 Relative coordinate X to target
+		line.append(str(shipfile['k1_XYRELATION'][1]) + ',')   #17 Relative coordinate Y to target
+	else:
+		line.append(',,')
+	line.append(shipfile.get('k5_DESTINAT', '').strip() + ',')	#18
+	line.append(str(shipfile.get('k0_SYSTEMCLOCK', '')) + ',')	#19
+	line.append(str(shipfile.get('k0_SECONDS', '')) + ',')	#20
+	line.append(str(shipfile.get('k0_TRUBBEL', 'dunno')))	#21 Default corruption flag. This could be either 'ok' or an error id.
+	# 'dunno' is a third possible flag value, strictly speaking.
+	line.append('\n')
+	return ''.join(line)
+
+
 def popuWrite(pList):
 	''' Dynamically updates a comma-separated file with selected
-	values from the "shipfile" dicts '''
-	
-	global secondsUp
-	global obsodelete
+	values from the shipfiles, as formatted by censusLine() '''
 
 	dummy = ['000000000,','INIT DUMMY,',',',',',',',',',',',',',',',\
 	'360,',',',',',',',',','1.0,','0,',',',',',',',',','1,','ok','\n']
@@ -1006,258 +1609,886 @@ def popuWrite(pList):
 	csvf = open('./data/census.csv','wb')	
 
 	for shipfile in pList:
-		diffy = int(secondsUp) - int(shipfile['k0_SECONDS'])
-		if diffy > 300:    # This value equals the minimum number of seconds of non-activity before annihilation! 
-			obsodelete = True			
-
-		if shipfile.has_key('k1_LAT_Dd'):	
-		# This diverts targets that lack LAT, LON, SOG, COG, HDG, ROT, etc, pending
-		# their presumed completion. Now, if the session's first dict from popuList
-		# contains only mess-type 5 data, i.e. has no 'k1_LAT_Dd' key etc, the 
-		# resulting empty list of the census-file will crash PloyPlotter.
-		# Update: We seem to have solved this more-or-less by some ungraceful 
-		# exception juggling in PloyPlot's while-loop.
-			if shipfile.has_key('k0_MMSI'):
-				line.append( str(shipfile['k0_MMSI']) + ',')	# 0
-			else:
-				continue			# NEW
-			if shipfile.has_key('k5_NAME'):
-				line.append( shipfile['k5_NAME'] + ',')	# 1
-			else:
-				line.append(',')
-			if shipfile.has_key('k5_CALLPHONO'):
-				line.append( shipfile['k5_CALLPHONO'] + ',')	# 2
-			else:
-				line.append(',')
-			if shipfile.has_key('k5_CALLSIGN'):
-				line.append( shipfile['k5_CALLSIGN'] + ',')	# 3
-			else:
-				line.append(',')
-			if shipfile.has_key('k1_NAVSTATUS'):
-				line.append( shipfile['k1_NAVLEGEND'] + ',')	# 4 Note key change
-			else:
-				line.append(',')
-			if shipfile.has_key('k5_TYPE'):
-				line.append( shipfile['k5_TYPE'] + ',')	# 5
-			else:
-				line.append(',')
-			if shipfile.has_key('k5_LOA'):
-				line.append( str(shipfile['k5_LOA']) + ',')	# 6
-			else:
-				line.append(',')
-			if shipfile.has_key('k5_BEAM'):
-				line.append( str(shipfile['k5_BEAM']) + ',')	# 7
-			else:
-				line.append(',')
-			if shipfile.has_key('k1_SOG'):
-				line.append( shipfile['k1_SOG'] + ',')	# 8
-			else:
-				line.append(',')
-			if shipfile.has_key('k1_COG'):
-				line.append( shipfile['k1_COG'] + ',')	# 9
-			else:
-				line.append('360,')	# Just to prevent hiccups in the plotter
-			if shipfile.has_key('k1_HDG'):
-				line.append( str(shipfile['k1_HDG']) + ',')	#10
-			else:
-				line.append(',')
-			if shipfile.has_key('k1_ROT'):
-				line.append( shipfile['k1_ROT'] + ',')	#11
-			else:
-				line.append(',')
-			if shipfile.has_key('k1_LAT_Dd'):
-				line.append( shipfile['k1_LAT_Dd'] + ',')	#12
-			else:
-				line.append(',')
-			if shipfile.has_key('k1_LON_Dd'):
-				line.append( shipfile['k1_LON_Dd'] + ',')	#13
-			else:
-				line.append(',')
-			if shipfile.has_key('k1_RANGE'):  # How do you like this little gem?: 
-				line.append(str(Decimal(str(round(shipfile['k1_RANGE'],2))).quantize(Decimal('0.01'))) + ',')	#14
-			else:
-				line.append(',')
-			if shipfile.has_key('k1_BEARING'):
-				line.append(str(shipfile['k1_BEARING']  + ','))	#15
-			else:
-				line.append(',')
-			if shipfile.has_key('k1_XYRELATION'):
-				line.append(str(shipfile['k1_XYRELATION'][0])  + ',')   #16 Relative coordinate X to target
-			else:
-				line.append(',')
-			if shipfile.has_key('k1_XYRELATION'):
-				line.append(str(shipfile['k1_XYRELATION'][1])  + ',')   #17 Relative coordinate Y to target
-			else:
-				line.append(',')
-			if shipfile.has_key('k5_DESTINAT'):
-				line.append( str.strip(shipfile['k5_DESTINAT']) + ',')	#18
-			else:
-				line.append(',')
-			if shipfile.has_key('k0_SYSTEMCLOCK'):
-				line.append(str( shipfile['k0_SYSTEMCLOCK']) + ',')	#19
-			else:
-				line.append(',')
-			if shipfile.has_key('k0_SECONDS'):
-				line.append( shipfile['k0_SECONDS'] + ',')	#20
-			else:
-				line.append(',')
-			if shipfile.has_key('k0_TRUBBEL'):
-				line.append (str( shipfile['k0_TRUBBEL'] )) #21 Default corruption flag. This could be either 'ok' or an error id.
-			else:
-				line.append('dunno') # This is a third possible flag value, strictly speaking.
-
-			line.append('\n')
-		else:
-			pass
+		if shipfile.census is None:
+			shipfile.census = censusLine(shipfile)
+		line.append(shipfile.census)
 
-		
 	csvf.writelines(line)
 	csvf.close()
 
 
-## ------------ Comment out the following three defs in static origo mode --------------
-## ------------ Comment out the following four defs in simulation mode -----------------
+## ------------ Comment out the following defs in static origo mode --------------
+## ------------ Comment out the following defs in simulation mode -----------------
 
 
-def findOrigo():       # simple "loop-and-try-again"
-	
-	retry = True
-	while retry:
-		line = []
-		line = ser.readline()
-		tmpOrigo = parseGPS(line.split(','))
-		if tmpOrigo[4] == 1:      # It's a GPRWC type of message!
-			origo = tmpOrigo
-			retry = False       
-	return origo
+class NMEAFramer(object):
+	''' Frames NMEA sentences out of a stream of bytes, read in pieces
+	of any size, such as all there is waiting in a serial port.
+	'''
+
+	def __init__(self):
+		self.buffer = ''   # The start of a sentence still to be finished
+
+	def feed(self, data):
+		''' Returns the nmea data (between the '$' or '!' and the '*') 
+		of the sentences completed by data, leaving out any that fail 
+		their checksum.
+		'''
+		lines = (self.buffer + data).split('\n')
+		self.buffer = lines.pop()[-framerLimit:]
+		sentences = []
+		for line in lines:
+			start = max(line.rfind('$'), line.rfind('!'))  # Fluff before it, if any
+			star = line.rfind('*')
+			if start < 0 or star < start:
+				continue
+			nmeadata = line[start + 1:star]
+			try:
+				cksum = int(line[star + 1:star + 3], 16)
+			except ValueError:
+				continue
+			if reduce(operator.xor, bytearray(nmeadata), 0) == cksum:
+				sentences.append(nmeadata)
+		return sentences
+
+
+class GPSReader(threading.Thread):
+	''' Reads own ship's state from the GPS port, in the background.
+	
+	Unless given an open port, it finds the GPS dongle's by itself (see
+	portScanUSB()), trying again every portRetry seconds till there is
+	one, and again if the port is lost. The port is read in bulk, all 
+	there is waiting at a time, and the sentences parsed by parseGPS().
+	The latest state is kept in fix, a GPSFix that is only ever 
+	replaced whole, never changed in place. So readers always get a 
+	consistent fix at once, and never wait on the port (but for the 
+	very first position).
+	'''
+
+	def __init__(self, port=None):
+		threading.Thread.__init__(self, name='GPS')
+		self.daemon = True   # Not to keep us alive
+		self.port = port
+		self.fix = noFix
+		self.ready = threading.Event()   # Set once there is a position
+
+	def run(self):
+		framer = NMEAFramer()
+		fix = self.fix
+		while True:
+			if self.port is None:
+				self.port = self.openPort()
+			try:
+				data = self.port.read(self.port.inWaiting() or 1)  # At least wait for a byte
+			except (serial.serialutil.SerialException, OSError):
+				print 'Lost the GPS port. Looking for it again...'
+				self.port = None
+				continue
+			for nmeadata in framer.feed(data):
+				fix = parseGPS(nmeadata, fix)
+			if fix is not self.fix:
+				self.fix = fix
+				if fix.origo is not None:
+					self.ready.set()
+
+	def openPort(self):
+		''' Finds, opens and primes the GPS port, waiting till there is one.'''
+		while True:
+			device = portScanUSB()
+			try:
+				if device:
+					port = serial.Serial(device, 4800, timeout=1)
+					port.flushInput()   # Prime it: what's been waiting is stale
+					return port
+			except (serial.serialutil.SerialException, OSError, ValueError):
+				pass
+			time.sleep(portRetry)
+
+	def origo(self):
+		''' Returns the latest position, waiting for the first one.'''
+		fix = self.fix
+		if fix.origo is None:
+			self.ready.wait()
+			fix = self.fix
+		return fix.origo
 		
 	
 	
-def parseGPS(lina):
-	'''Processes NMEA 0183 formatted GPS position data (DD:MM.mm).
-	Returns a tuple of latitude, longitude (DD.dd), and a $GP type confirmation flag. 
+def nmeaFloat(value, default=None):
+	''' Returns an NMEA number field as a float, or default if empty.'''
+
+	if value == '':
+		return default
+	return float(value)
+
+
+def nmeaPosition(lati, NS, longi, EW):
+	''' Converts NMEA 0183 position fields (DDMM.mm, DDDMM.mm) to a
+	position tuple like myPosGPS, in decimal degrees.
 	'''
 
-	latitude  	= 0.0
-	NS 		= ''
-	longitude 	= 0.0
-	EW 		= ''
+	dot = lati.index('.')
+	latitude = float(lati[:dot - 2]) + (float(lati[dot - 2:])/60.0)
+	dot = longi.index('.')
+	longitude = float(longi[:dot - 2]) + (float(longi[dot - 2:])/60.0)
+	if NS not in ('N', 'S') or EW not in ('E', 'W'):
+		raise ValueError('No hemisphere')
+	return latitude, NS, longitude, EW
 
-	if lina[0] == '$GPRMC':
-		try:
-			RMC = 1
-			latitude = float(lina[3][0:2]) + (float(lina[3][2:])/60.0)
-			NS = lina[4]
-			longitude = float(lina[5][0:3]) + (float(lina[5][3:])/60.0)
-			EW = lina[6]
-		except ValueError:
-			RMC = 0
-			latitude = 0
-			NS = 0
-			longitude = 0
-			EW = 0
-			print "GPS ValueError!"
-		except IndexError:
-			RMC = 0
-			latitude = 0
-			NS = 0
-			longitude = 0
-			EW = 0
-			print "GPS IndexError!"
-		
-	else:
-		RMC = 0
-		latitude = 0
-		NS = 0
-		longitude = 0
-		EW = 0
 
-	return latitude, NS, longitude, EW, RMC
+def parseGPS(nmeadata, fix):
+	'''Processes one NMEA 0183 sentence from the GPS, as nmea data 
+	(see NMEAFramer), into own ship's state. Understands RMC, GGA, VTG
+	and HDT, from any talker (GP, GN etc).
+	
+	Returns the GPSFix fix updated, or fix itself if there's nothing 
+	new in the sentence. 
+	'''
+
+	lina = nmeadata.split(',')
+	kind = lina[0][2:]
+	try:
+		if kind == 'RMC' and lina[2] == 'A':    # A valid fix
+			return fix._replace(origo=nmeaPosition(*lina[3:7]), 
+				sog=nmeaFloat(lina[7], fix.sog), cog=nmeaFloat(lina[8], fix.cog), 
+				time=time.time())
+		if kind == 'GGA' and lina[6] not in ('', '0'):
+			return fix._replace(origo=nmeaPosition(*lina[2:6]), time=time.time())
+		if kind == 'VTG':
+			return fix._replace(cog=nmeaFloat(lina[1], fix.cog), 
+				sog=nmeaFloat(lina[5], fix.sog))
+		if kind == 'HDT':
+			return fix._replace(heading=nmeaFloat(lina[1], fix.heading))
+	except ValueError:
+		print "GPS ValueError!"
+	except IndexError:
+		print "GPS IndexError!"
+	return fix
+
+
+def portProbe(device):
+	''' Tells whether device opens as a serial port.'''
+
+	try:
+		port = serial.Serial(device, timeout=0)
+		port.close()
+		return True
+	except (serial.serialutil.SerialException, OSError, ValueError):
+		return False
 
 
 def portScanUSB():
+	''' Finds the serial port of the GPS dongle: the one found last 
+	time (as kept in portCacheFile) if it still opens, else the first 
+	of the existing /dev/ttyUSB* devices that does.
+	
+	Returns its device name, or '' if none was found.
+	'''
+
 	usbport = '/dev/ttyUSB'
-	found = False
-	eureka = ''
-	for i in range(64):
-		if found == False:    # This will return only the port found first
+	try:
+		cached = open(portCacheFile).read().strip()
+	except IOError:
+		cached = ''
+	if cached and portProbe(cached):
+		return cached
+	devices = [device for device in glob.glob(usbport + '*') 
+		if device[len(usbport):].isdigit()]
+	devices.sort(key=lambda device: int(device[len(usbport):]))
+	for device in devices:
+		if device != cached and portProbe(device):
+			print 'Found', device
 			try:
-				ser = serial.Serial(usbport + str(i))
-				ser.close()
-				print 'Found ttyUSB', i, ' (a.k.a. COM', i + 1, ')'
-				eureka = usbport + str(i) 
-				found = True
-			except serial.serialutil.SerialException:
+				open(portCacheFile, 'w').write(device + '\n')
+			except IOError:
 				pass
-	if not found:
-		print 'No ports found. Make sure the GPS sensor is connected, etc.'
-	return eureka
+			return device
+	print 'No ports found. Make sure the GPS sensor is connected, etc.'
+	return ''
+## ------------ Comment out the preceding defs in static origo mode --------------
 
-## ------------ Comment out the preceding three defs in static origo mode --------------
+## ------------ Comment out the preceding defs in simulation mode -----------------
+
+
+## ------------ Input sources -----------------
+# Each source is read by a thread of its own, all of them feeding one
+# queue with (source name, line) pairs. So a slow or silent source 
+# doesn't hold up the others, nor the decoding.
+
+class InotifyWatch(object):
+	''' Waits for changes in a directory, through Linux' inotify (by
+	way of ctypes).
+	'''
+
+	def __init__(self, directory):
+		libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+		self.fd = libc.inotify_init()
+		if self.fd < 0 or libc.inotify_add_watch(self.fd, directory, inotifyMask) < 0:
+			raise OSError(ctypes.get_errno(), 'inotify failed on ' + directory)
+
+	def wait(self, timeout):
+		''' Returns when something changed, or after timeout seconds.'''
+		if select.select([self.fd], [], [], timeout)[0]:
+			os.read(self.fd, 65536)   # Never mind what it was
+
+
+class PollWatch(object):
+	''' Stands in for InotifyWatch where there's no inotify.'''
+
+	def wait(self, timeout):
+		''' Returns after a poll interval, at most timeout seconds.'''
+		time.sleep(min(timeout, pollInterval))
 
-def flushLog(filename):
-	'''Zap all contents in file filename'''
-	
-# This function empties the file AISMon.log in an attempt to always keep it small, but 
-# it seems AISMon.exe writes its complete buffer back to its logfile for each sync.
-# The simple way to empty the buffer and stop the logfile growing very large is to 
-# occasionally cycle the "Stop/Start monitoring" button in AISMons control window.
 
-	nulline = '\x00'
+def watchDirectory(directory):
+	''' Returns an InotifyWatch on directory if possible, else a 
+	PollWatch.
+	'''
+
 	try:
-		log = open(filename,'w+')
+		return InotifyWatch(directory)
+	except (OSError, AttributeError, TypeError):
+		return PollWatch()
+
+
+class LogTail(object):
+	''' Follows a log file as it is written to, like tail -f, reading 
+	it in chunks of chunkSize bytes; iterate over it for the lines.
+	
+	The file is never written to. It's kept open, and read on from 
+	where it was left, with a wake-up (from inotify where there is 
+	one) whenever the directory changes. If the file is truncated, it
+	is read again from the start; if it's replaced (rotated), which is
+	told by its inode, the new one is opened once the old one is done.
+	
+	offset is where the last complete line handed out ends, in the 
+	file of inode; these tell where to resume, when given.
+	'''
+
+	def __init__(self, path, offset=0, inode=None, chunkSize=65536):
+		self.path = path
+		self.offset = offset
+		self.inode = inode
+		self.chunkSize = chunkSize
+		self.log = None
+		self.partial = ''    # The start of a line still being written
+		self.watch = watchDirectory(os.path.dirname(os.path.abspath(path)))
+
+	def __iter__(self):
+		while True:
+			if self.log is None and not self.open():
+				self.watch.wait(tailTimeout)
+				continue
+			data = self.log.read(self.chunkSize)
+			if data:
+				lines = (self.partial + data).split('\n')
+				self.partial = lines.pop()
+				for line in lines:
+					self.offset += len(line) + 1
+					yield line + '\n'
+				continue
+			try:
+				stat = os.stat(self.path)
+			except OSError:
+				stat = None   # Gone, for now
+			if stat is not None and stat.st_ino != self.inode:
+				self.log.close()   # Done with the old one: on to the new
+				self.log = None
+				self.offset = 0
+				self.inode = None
+				self.partial = ''
+			elif stat is not None and stat.st_size < self.offset + len(self.partial):
+				self.log.seek(0)   # Truncated: start all over
+				self.offset = 0
+				self.partial = ''
+			else:
+				self.watch.wait(tailTimeout)
+
+	def position(self):
+		''' Returns the inode and offset reached, to resume from.'''
+		return self.inode, self.offset
+
+	def open(self):
+		''' Opens the file, at offset if it's the same one as before.
+		Returns False if it can't be opened (yet).
+		'''
 		try:
-			log.write(nulline)  # write an empty string
-		finally:
-			log.close()
+			self.log = open(self.path, 'rb')
+		except IOError:
+			return False
+		stat = os.fstat(self.log.fileno())
+		if stat.st_ino != self.inode or stat.st_size < self.offset:
+			self.offset = 0   # Not the file we were reading
+		self.inode = stat.st_ino
+		self.log.seek(self.offset)
+		self.partial = ''
+		return True
+
+
+def portLines(port):
+	''' Yields the lines read from an open serial port.'''
+
+	while True:
+		line = port.readline()
+		if line:
+			yield line
+
+
+def serialLines(device, baudrate=38400, retry=5.0):
+	''' Yields the lines read from a serial device, opening it again
+	after retry seconds if it can't be opened or is lost.
+	'''
+
+	while True:
+		try:
+			port = serial.Serial(device, baudrate, timeout=1)
+			try:
+				for line in portLines(port):
+					yield line
+			finally:
+				port.close()
+		except (serial.serialutil.SerialException, OSError), error:
+			print 'AIS port %s:' % (device), error
+		time.sleep(retry)
+
+
+def tcpLines(host, port, retry=5.0):
+	''' Yields the lines sent by an NMEA server over TCP, connecting
+	again after retry seconds if the connection fails or is closed.
+	'''
+
+	while True:
+		try:
+			conn = socket.create_connection((host, port), 10)
+			conn.settimeout(None)
+			try:
+				for line in iter(conn.makefile('rb').readline, ''):
+					yield line
+			finally:
+				conn.close()
+		except socket.error, error:
+			print 'NMEA server %s:%s:' % (host, port), error
+		time.sleep(retry)
+
+
+def feedQueue(name, lines, queue):
+	''' Puts the lines from one source on the queue, tagged with the
+	source's name and, for sources telling their position (LogTail), 
+	the position after the line; else None.
+	'''
+
+	position = getattr(lines, 'position', None)
+	for line in lines:
+		queue.put((name, line, position and position()))
+
+
+def startSources(sources, queue=None):
+	''' Starts a reader thread for each source, in a dict of iterables
+	of lines by name, all feeding one queue.
+	
+	Returns the queue, a new one unless given.
+	'''
+
+	if queue is None:
+		queue = Queue.Queue(feedSize)
+	for name in sources:
+		reader = threading.Thread(target=feedQueue, name=name,
+			args=(name, sources[name], queue))
+		reader.daemon = True   # Not to keep us alive
+		reader.start()
+	return queue
+
+
+
+## ------------ Checkpoints -----------------
+# What it takes to pick up where we left off, after a restart: where 
+# the inputs were read to, the multipart messages in flight, and the 
+# targets. Saved every checkpointInterval seconds, and when we quit.
+
+def saveCheckpoint(path, positions, decoder, targets):
+	''' Saves a checkpoint, of the positions reached in the inputs (by 
+	source name), the decoder's fragments in flight, and the targets.
+	
+	The state goes to a new file first, which then replaces the old 
+	one, so there's always a whole checkpoint to load.
+	'''
+
+	state = {'positions' : positions, 
+		'fragments' : decoder.reassembler.slots, 
+		'targets' : list(targets)}
+	newFile = path + '.new'
+	out = open(newFile, 'wb')
+	try:
+		cPickle.dump(state, out, cPickle.HIGHEST_PROTOCOL)
+		out.flush()
+		os.fsync(out.fileno())
+	finally:
+		out.close()
+	os.rename(newFile, path)
+
+
+def loadCheckpoint(path, decoder, targets):
+	''' Loads the checkpoint saved last, if any, putting the fragments 
+	in flight back in decoder and the targets in the TargetStore targets.
+	
+	Returns the positions reached in the inputs, by source name.
+	'''
+
+	try:
+		state = cPickle.load(open(path, 'rb'))
+		positions = state['positions']
+		decoder.reassembler.slots = state['fragments']
+		targets.clear()
+		for shipfile in state['targets']:
+			targets.update(shipfile)
 	except IOError:
-		print 'Can\'t find or open "AISMon.log" for zapping (IOError)'
-		pass
-		
-## ------------ Comment out the preceding four defs in simulation mode -----------------
+		return {}    # None saved yet
+	except Exception, error:
+		print 'Can\'t use checkpoint %s: %r' % (path, error)
+		return {}
+	return positions
+
+
+## ------------ Generator pipeline -----------------
+# The decoding, taken apart into lazy stages, each passing on one item
+# at a time. So any feed, however long, is run in constant memory, and 
+# stages of one's own may be put in between. E.g.:
+#
+#   for target in target_updates(decoded_records(reassembled_messages(
+#           valid_sentences(read_lines(ipf))), batchOrigo)):
+#       print target['k0_MMSI']
+
+def read_lines(source):
+	''' Yields the lines of source, a file name or any iterable of 
+	lines (such as an open file), leaving out the empty ones.
+	'''
+
+	if isinstance(source, basestring):
+		source = open(source, 'rb')
+	for line in source:
+		if len(line) > 4:   # Empty lines in file?
+			yield line
+
+
+def valid_sentences(lines):
+	''' Yields the sentences that check out, dropping the garbled ones
+	and those that fail their checksum.
+	'''
+
+	for line in lines:
+		try:
+			data, cksum, calc_cksum = checkSumCheck(line)
+		except ValueError:
+			continue
+		if cksum == calc_cksum:
+			yield line
+
+
+def reassembled_messages(sentences, decoder=None, clock=time.time):
+	''' Yields the payloads of the messages completed by sentences, 
+	i.e. of single-sentence messages and reassembled multipart ones, 
+	leaving out copies, malformed sentences and the types decoder 
+	doesn't handle.
+	
+	decoder holds the state: a new AISDecoder unless given. clock 
+	tells the time, for its time windows.
+	'''
+
+	if decoder is None:
+		decoder = AISDecoder()
+	for sentence in sentences:
+		try:
+			payload = decoder.reassemble(sentence, clock())
+		except ValueError:
+			continue   # Short of fields, or misnumbered
+		if payload is not None:
+			yield payload
+
+
+def decoded_records(messages, origo, decoder=None, clock=time.time):
+	''' Yields the records decoded from message payloads, as seen from
+	own ship's position origo (or a function returning it).
+	
+	decoder holds the state: a new AISDecoder unless given. clock 
+	tells the time, for the records' timestamps.
+	'''
+
+	if decoder is None:
+		decoder = AISDecoder()
+	for payload in messages:
+		for record in decoder.decodeMessage(payload, origo, clock()):
+			yield record
+
+
+def target_updates(records):
+	''' Files records with their targets in popuStore, and yields each 
+	target changed by that (in more than its timestamps).
+	'''
+
+	for record in records:
+		if upDatePPL(record):
+			yield popuStore.newest()
+
+
+## ------------ Batch decoding of archived logs -----------------
+
+def fragmentHeader(input):
+	''' Reads the fragment header of a VDM sentence.
+	
+	Returns its parts count, part number, sequential message ID and
+	channel, or None for single-sentence and malformed ones.
+	'''
+
+	a1 = input.find('!AIV')
+	shortList = input[a1 + 7:].split(',', 4)
+	if len(shortList) < 5 or not (shortList[0].isdigit() and shortList[1].isdigit()):
+		return None
+	if shortList[0] == '1':
+		return None
+	return int(shortList[0]), int(shortList[1]), shortList[2], shortList[3]
+
+
+def logChunks(path, count):
+	''' Splits a log file into (at most) count byte ranges, each one
+	ending at a line end. Returns a list of (start, end) offsets.
+	'''
+
+	size = os.path.getsize(path)
+	bounds = [0]
+	log = open(path, 'rb')
+	for i in range(1, count):
+		pos = max(size * i // count, bounds[-1])
+		if pos > 0:
+			log.seek(pos - 1)
+			log.readline()   # Move on to the start of the next line
+			pos = log.tell()
+		bounds.append(pos)
+	log.close()
+	bounds.append(size)
+	return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def dupeScan(job):
+	''' Reads the duplicate filter's keys off one byte range of a log, 
+	for decodeLog(). job is a tuple (path, start, end).
+	
+	Returns (byte offset, key) pairs, for the sentences that check out
+	and have a key.
+	'''
+
+	path, start, end = job
+	keys = []
+	log = open(path, 'rb')
+	log.seek(start)
+	pos = start
+	while pos < end:
+		line = log.readline()
+		where = pos
+		pos += len(line)
+		if len(line) <= 4:
+			continue
+		try:
+			data, cksum, calc_cksum = checkSumCheck(line)
+		except ValueError:
+			continue
+		if cksum == calc_cksum:
+			key = dupeKey(data)
+			if key is not None:
+				keys.append((where, key))
+	log.close()
+	return keys
+
+
+def decodeChunk(job):
+	''' Decodes one byte range of a log, for decodeLog(). job is a
+	tuple (path, start, end, origo, offset, t0, copies), copies being 
+	the byte offsets of the sentences the duplicate filter drops.
+	
+	Returns the records decoded, and the fragments of multipart 
+	messages that may be finished in the neighbouring ranges, i.e. 
+	those following on from a part before start, and those of messages
+	still unfinished at end; each as (byte offset, item) pairs.
+	'''
+
+	path, start, end, origo, offset, t0, copies = job
+	decoder = AISDecoder(offset=offset)
+	decoder.dupeFilter = DupeFilter(window=0)   # The copies are known already
+	records = []
+	loose = []     # Follow-on fragments with no first part in range
+	pending = {}   # Fragments of messages in flight, by reassembly key
+	log = open(path, 'rb')
+	log.seek(start)
+	pos = start
+	while pos < end:
+		line = log.readline()
+		where = pos
+		pos += len(line)
+		if len(line) <= 4:
+			continue
+		header = fragmentHeader(line)
+		if header is not None:
+			partsCount, partNumber, sequentID, channel = header
+			key = (channel, sequentID, partsCount)
+			if partNumber != 1 and not decoder.reassembler.expects(partsCount, sequentID, channel):
+				loose.append((where, line))
+				continue
+		if where in copies:
+			found = []   # Heard that already: drop the copy
+		else:
+			try:
+				found = decoder.decode(line, origo, t0 + where / logRate)
+			except ValueError:
+				continue
+		if header is not None:
+			if not decoder.reassembler.expects(partsCount, sequentID, channel):
+				pending.pop(key, None)
+			elif partNumber == 1:
+				pending[key] = [(where, line)]
+			else:
+				pending[key].append((where, line))
+		records.extend([(where, record) for record in found])
+	log.close()
+	unfinished = [fragment for slot in pending 
+		if decoder.reassembler.expects(slot[2], slot[1], slot[0]) 
+		for fragment in pending[slot]]
+	return records, loose, unfinished
+
+
+def decodeLog(path, origo, offset=(0, 0), workers=None):
+	''' Decodes a whole AIVDM log file, in parallel on workers processes 
+	(one per CPU by default), as seen from own ship's position origo.
+	
+	Returns the records decoded, in the order of the log. Each process 
+	takes a range of the log; the multipart messages straddling ranges 
+	are put together here, from the fragments left over at their ends.
+	Logs carry no times of their own, so time is taken to pass with 
+	the position in the log, at logRate bytes per second. 
+	
+	The duplicate filter can't be split up the same way, as what it 
+	drops depends on all it heard before. So the processes first read
+	off the sentences' keys, which go through one filter here, in the
+	order of the log; the decoding then skips the copies it found. The
+	records come out the same, whatever the number of workers.
+	'''
+
+	if workers is None:
+		workers = multiprocessing.cpu_count()
+	t0 = time.time()
+	ranges = logChunks(path, workers)
+	pool = None
+	if workers > 1 and len(ranges) > 1:
+		pool = multiprocessing.Pool(workers)
+	try:
+		mapper = pool.map if pool is not None else map
+		dupeFilter = DupeFilter()
+		copies = []
+		for keys in mapper(dupeScan, [(path, start, end) for start, end in ranges]):
+			copies.append(set([where for where, key in keys 
+				if dupeFilter.seen(key, t0 + where / logRate)]))
+		results = mapper(decodeChunk, [(path, start, end, origo, offset, t0, dropped) 
+			for (start, end), dropped in zip(ranges, copies)])
+	except:
+		if pool is not None:   # close() would wait on the workers for ever
+			pool.terminate()
+			pool.join()
+		raise
+	if pool is not None:
+		pool.close()
+		pool.join()
+
+# Stitch the messages straddling the ranges
+	stitcher = AISDecoder(offset=offset)
+	stitcher.dupeFilter = DupeFilter(window=0)
+	copies = set().union(*copies)
+	records = []
+	unfinished = []
+	for chunkRecords, loose, chunkUnfinished in results:
+		for where, line in sorted(unfinished + loose):
+			if where in copies:
+				continue
+			try:
+				found = stitcher.decode(line, origo, t0 + where / logRate)
+			except ValueError:
+				continue
+			records.extend([(where, record) for record in found])
+		records.extend(chunkRecords)
+		unfinished = chunkUnfinished
+	records.sort(key=operator.itemgetter(0))
+	return [record for where, record in records]
+
+
+def batchMain(argv):
+	''' Decodes archived logs from the command line, into the census file.'''
+
+	parser = argparse.ArgumentParser(
+		description='Decode AIVDM logs in parallel, into ./data/census.csv.')
+	parser.add_argument('logs', nargs='+', metavar='LOG', 
+		help='log file(s) to decode, in order')
+	parser.add_argument('-j', '--workers', type=int, default=None,
+		help='worker processes (default: one per CPU)')
+	parser.add_argument('--origo', default=','.join(batchOrigo),
+		help='own ship as LAT,N/S,LON,E/W (default: %(default)s)')
+	args = parser.parse_args(argv)
+	origo = tuple(args.origo.split(','))
+
+	count = 0
+	for path in args.logs:
+		started = time.time()
+		records = decodeLog(path, origo, myOffset, args.workers)
+		for record in records:
+			upDatePPL(record)
+		count += len(records)
+		print '%s: %d records in %.1f s' % (path, len(records), time.time() - started)
+	popuWrite(popuStore)
+	print count, 'records,', len(popuStore), 'targets written to ./data/census.csv'
+	print 'Target store:', popuStore.usage()
 
 
 # ##################################################################
 # ------------------ Global Vars and Constants ---------------------
 # ##################################################################
 
-# The following dict returns the complement of a single bit.
-# (Simpler than a function based on an if-else test...)
-# Works for ASCII and numeric!
-# A binary point/period is its own "complement", for convenience:
-bitComplement = { '0':'1', '1':'0',  0:1, 1:0 , '.':'.' }
-
-partsCount = []
-partNumber = []
-sequentID = []
-payLoad = []
-stashedPart = []
-stashedSequentID = [] 
-_04_NavStatus = []
+# De-armoring table: the six bits carried by each payload char, as two
+# octal digits. Built for all 256 byte values, so stray chars decode the
+# same way as ever (ord - 48, less another 8 above 40, in six bits).
+armorOctal = ['%02o' % ((c - 48 - 8*(c - 48 > 40)) & 63) for c in range(256)]
+# The same, for NumPy: six-bit values, and hex digit values (4096 if no digit)
+if numpy is not None:
+	armorSixBits = numpy.array([int(o, 8) for o in armorOctal], numpy.uint8)
+	hexValues = numpy.array([int(chr(c), 16) if chr(c) in '0123456789ABCDEFabcdef'
+	else 4096 for c in range(256)], numpy.int64)
+# Six-bit text tables, indexed by six-bit char value:
+sixBitChars = '@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_ !"#$%&\'()*+,-./0123456789:;<=>?'
+sixBitASCIItable = sixBitChars + '\x00' * (256 - len(sixBitChars))
+sixBitICAOlist = ['','-Alfa','-Bravo','-Charlie','-Delta','-Echo','-Foxtrot',
+'-Golf','-Hotel','-India','-Juliet','-Kilo','-Lima','-Mike','-November','-Oscar',
+'-Papa','-Quebec','-Romeo','-Sierra','-Tango','-Uniform','-Victor','-Whiskey',
+'-XRay','-Yankee','-Zulu'] + list(sixBitChars[27:48]) + ['-0','-1','-2','-3',
+'-4','-5','-6','-7','-8','-9'] + list(sixBitChars[58:])
+sixBitICAOdict = dict(zip(sixBitChars, sixBitICAOlist))
+
+# Message layouts: (name, offset, width, kind[, scale]) per field, where 
+# kind is 'u' unsigned, 'i' signed or 't' six-bit text. Each layout is
+# compiled once, below, into a dedicated extractor by compileSpec().
+# Positions come in 1/10000 minutes (1/10 minutes in type 27), and are 
+# scaled to decimal degrees.
+posReportSpec = [('MessageID', 0, 6, 'u'), ('RepeatIndicator', 6, 2, 'u'),
+('MMSI', 8, 30, 'u'), ('NavStatus', 38, 4, 'u'), ('ROT', 42, 8, 'i'),
+('SOG', 50, 10, 'u', 10), ('PositionAccuracy', 60, 1, 'u'),
+('Longitude', 61, 28, 'i', 600000), ('Latitude', 89, 27, 'i', 600000),
+('COG', 116, 12, 'u', 10), ('TrueHeading', 128, 9, 'u'), ('TimeStamp', 137, 6, 'u'),
+('Maneuver', 143, 2, 'u'), ('RAIM', 148, 1, 'u')]
+msgSpecs = {
+	1 : posReportSpec,
+	2 : posReportSpec,
+	3 : posReportSpec,
+	4 : [('MessageID', 0, 6, 'u'), ('RepeatIndicator', 6, 2, 'u'),
+	('MMSI', 8, 30, 'u'), ('Year', 38, 14, 'u'), ('Month', 52, 4, 'u'),
+	('Day', 56, 5, 'u'), ('Hour', 61, 5, 'u'), ('Minute', 66, 6, 'u'),
+	('Second', 72, 6, 'u'), ('PositionAccuracy', 78, 1, 'u'),
+	('Longitude', 79, 28, 'i', 600000), ('Latitude', 107, 27, 'i', 600000),
+	('EPFD', 134, 4, 'u'),
+	('RAIM', 148, 1, 'u')],
+	5 : [('MessageID', 0, 6, 'u'), ('RepeatIndicator', 6, 2, 'u'),
+	('MMSI', 8, 30, 'u'), ('AISVersion', 38, 2, 'u'), ('IMO', 40, 30, 'u'),
+	('CallSign', 70, 42, 't'), ('ShipName', 112, 120, 't'), ('ShipType', 232, 8, 'u'),
+	('DimBow', 240, 9, 'u'), ('DimStern', 249, 9, 'u'), ('DimPort', 258, 6, 'u'),
+	('DimStarboard', 264, 6, 'u'), ('EPFD', 270, 4, 'u'), ('ETAMonth', 274, 4, 'u'),
+	('ETADay', 278, 5, 'u'), ('ETAHour', 283, 5, 'u'), ('ETAMinute', 288, 6, 'u'),
+	('Draught', 294, 8, 'u', 10), ('Destination', 302, 120, 't'), ('DTE', 422, 1, 'u')],
+	18 : [('MessageID', 0, 6, 'u'), ('RepeatIndicator', 6, 2, 'u'),
+	('MMSI', 8, 30, 'u'), ('SOG', 46, 10, 'u', 10), ('PositionAccuracy', 56, 1, 'u'),
+	('Longitude', 57, 28, 'i', 600000), ('Latitude', 85, 27, 'i', 600000),
+	('COG', 112, 12, 'u', 10),
+	('TrueHeading', 124, 9, 'u'), ('TimeStamp', 133, 6, 'u'), ('CSUnit', 141, 1, 'u'),
+	('RAIM', 147, 1, 'u')],
+	19 : [('MessageID', 0, 6, 'u'), ('RepeatIndicator', 6, 2, 'u'),
+	('MMSI', 8, 30, 'u'), ('SOG', 46, 10, 'u', 10), ('PositionAccuracy', 56, 1, 'u'),
+	('Longitude', 57, 28, 'i', 600000), ('Latitude', 85, 27, 'i', 600000),
+	('COG', 112, 12, 'u', 10),
+	('TrueHeading', 124, 9, 'u'), ('TimeStamp', 133, 6, 'u'), ('ShipName', 143, 120, 't'),
+	('ShipType', 263, 8, 'u'), ('DimBow', 271, 9, 'u'), ('DimStern', 280, 9, 'u'),
+	('DimPort', 289, 6, 'u'), ('DimStarboard', 295, 6, 'u'), ('EPFD', 301, 4, 'u'),
+	('RAIM', 305, 1, 'u'), ('DTE', 306, 1, 'u')],
+	21 : [('MessageID', 0, 6, 'u'), ('RepeatIndicator', 6, 2, 'u'),
+	('MMSI', 8, 30, 'u'), ('AidType', 38, 5, 'u'), ('Name', 43, 120, 't'),
+	('PositionAccuracy', 163, 1, 'u'), ('Longitude', 164, 28, 'i', 600000),
+	('Latitude', 192, 27, 'i', 600000), ('DimBow', 219, 9, 'u'), ('DimStern', 228, 9, 'u'),
+	('DimPort', 237, 6, 'u'), ('DimStarboard', 243, 6, 'u'), ('EPFD', 249, 4, 'u'),
+	('Second', 253, 6, 'u'), ('OffPosition', 259, 1, 'u'), ('RAIM', 268, 1, 'u'),
+	('VirtualAid', 269, 1, 'u')],
+	(24, 0) : [('MessageID', 0, 6, 'u'), ('RepeatIndicator', 6, 2, 'u'),
+	('MMSI', 8, 30, 'u'), ('PartNumber', 38, 2, 'u'), ('ShipName', 40, 120, 't')],
+	(24, 1) : [('MessageID', 0, 6, 'u'), ('RepeatIndicator', 6, 2, 'u'),
+	('MMSI', 8, 30, 'u'), ('PartNumber', 38, 2, 'u'), ('ShipType', 40, 8, 'u'),
+	('VendorID', 48, 18, 't'), ('CallSign', 90, 42, 't'), ('DimBow', 132, 9, 'u'),
+	('DimStern', 141, 9, 'u'), ('DimPort', 150, 6, 'u'), ('DimStarboard', 156, 6, 'u')],
+	27 : [('MessageID', 0, 6, 'u'), ('RepeatIndicator', 6, 2, 'u'),
+	('MMSI', 8, 30, 'u'), ('PositionAccuracy', 38, 1, 'u'), ('RAIM', 39, 1, 'u'),
+	('NavStatus', 40, 4, 'u'), ('Longitude', 44, 18, 'i', 600),
+	('Latitude', 62, 17, 'i', 600), ('SOG', 79, 6, 'u'), ('COG', 85, 9, 'u'),
+	('GNSS', 94, 1, 'u')]}
+msgExtractors = dict([(t, compileSpec(msgSpecs[t])) for t in msgSpecs])
+fieldGetters = dict([(t, compileGetters(msgSpecs[t])) for t in msgSpecs])
+subsetExtractors = {}  # Compiled on demand, keyed by (msgId, field names)
+# The fields our own handlers read from each message type:
+posReportFields = ('MMSI', 'NavStatus', 'ROT', 'SOG', 'Latitude', 'Longitude',
+'COG', 'TrueHeading', 'TimeStamp')
+baseReportFields = ('MMSI', 'Latitude', 'Longitude')
+tripDataFields = ('MMSI', 'IMO', 'CallSign', 'ShipName', 'ShipType', 'DimBow',
+'DimStern', 'DimPort', 'DimStarboard', 'ETAMonth', 'ETADay', 'ETAHour', 
+'ETAMinute', 'Destination')
+# Handlers for the (reassembled) message types we plot. AISDecoder skips
+# all other types unread, by their first payload char (see typeChars()).
+msgHandlers = {1 : CommonNavigationBlock, 2 : CommonNavigationBlock,
+3 : CommonNavigationBlock, 4 : BaseStationReport, 5 : ShipTripData}
 navstatus_legend = []
-popuList = [{},]
-keyList1 = ['k0_SYSTEMCLOCK', 'k0_SECONDS', 'k0_MMSI','k1_NAVSTATUS','k1_NAVLEGEND',
-'k1_ROT','k1_SOG','k1_LAT_Dd','k1_LAT_D_Mm','k1_LON_Dd','k1_LON_D_Mm',
-'k1_RANGE','k1_BEARING','k1_XYRELATION','k1_COG','k1_HDG','k1_TIMESTAMP','k0_TRUBBEL']  ## 18 items
-keyList4 = ['k0_SYSTEMCLOCK', 'k0_SECONDS','k0_MMSI','k5_NAME','k1_LAT_Dd','k1_LAT_D_Mm',
-'k1_LON_Dd','k1_LON_D_Mm','k1_RANGE','k1_BEARING','k1_XYRELATION','k0_TRUBBEL']  ## 12 items
-keyList5 = ['k0_SYSTEMCLOCK', 'k0_SECONDS','k0_MMSI','k5_IMO','k5_CALLPHONO',
+maxTargets = 5000   # Targets kept at most, the least recently heard being evicted
+maxTargetBytes = 8*1024*1024   # Ditto, bytes they take (see shipfileBytes())
+# The columns of a TargetTable, and the flags of its rows
+targetColumns = [('mmsi', 'i8'), ('lat', 'f8'), ('lon', 'f8'), ('sog', 'f4'), 
+('cog', 'f4'), ('heading', 'f4'), ('range', 'f8'), ('bearing', 'f4'), 
+('x', 'f8'), ('y', 'f8'), ('seen', 'f8'), ('flags', 'u1')]
+rowInUse = 1
+rowBaseStation = 2
+rowGoofy = 4   # Its position is out of bounds (see coordCheck())
+columnarTable = True   # Keep the targets' numbers in a TargetTable too, given NumPy
+if numpy is not None and columnarTable:
+	popuStore = TargetStore(maxTargets, maxTargetBytes, TargetTable())
+else:
+	popuStore = TargetStore(maxTargets, maxTargetBytes)
+keyList1 = ['k0_SYSTEMCLOCK', 'k0_SECONDS', 'k0_MMSI','k1_NAVSTATUS',
+'k1_ROT','k1_SOG','k1_LAT_Dd','k1_LON_Dd',
+'k1_RANGE','k1_BEARING','k1_XYRELATION','k1_COG','k1_HDG','k1_TIMESTAMP','k0_TRUBBEL']  ## 15 items
+keyList4 = ['k0_SYSTEMCLOCK', 'k0_SECONDS','k0_MMSI','k5_NAME','k1_LAT_Dd',
+'k1_LON_Dd','k1_RANGE','k1_BEARING','k1_XYRELATION','k0_TRUBBEL']  ## 10 items
+keyList5 = ['k0_SYSTEMCLOCK', 'k0_SECONDS','k0_MMSI','k5_IMO',
 'k5_CALLSIGN','k5_NAME','k5_TYPE','k5_LOA','k5_BEAM','k5_ETA_Mo','k5_ETA_Dy',
-'k5_ETA_Hr','k5_ETA_Mi','k5_DESTINAT']  ## 15 items
-valList = []
-oXY_ratio = []
-lastWord = {}
-spurio = 'ok'  # Error code flag reset. (Valid IDs: # 01 == Lat out of bounds, 02 == Ditto for Lon)
-inputt = ''
-idBits = ''
+'k5_ETA_Hr','k5_ETA_Mi','k5_DESTINAT']  ## 14 items
+# Own ship's state from the GPS: position (like myPosGPS), speed (kn), 
+# course and heading (deg), and the time of the position fix
+GPSFix = namedtuple('GPSFix', 'origo sog cog heading time')
+noFix = GPSFix(None, None, None, None, None)
+framerLimit = 4096   # Longest start of an NMEA sentence kept waiting for its end
+portCacheFile = './data/gpsport.txt'   # The GPS port found last time
+portRetry = 5.0    # Seconds between looks for a GPS port, while there is none
+tailTimeout = 1.0   # Seconds a LogTail waits for news before looking anyway
+pollInterval = 0.25   # Seconds between looks at a log, without inotify
+# inotify events to wake a LogTail: IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE, 
+# IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE
+inotifyMask = 0x002 | 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+checkpointFile = './data/checkpoint.pkl'   # Where to pick up after a restart
+checkpointInterval = 30.0   # Seconds between checkpoints
+batchLines = 65536   # Lines decode_batch() decodes at a time
+feedSize = 10000   # Lines queued from the inputs at most, before their readers wait
+fleetRefix = 0.05   # Nautical miles own ship moves before all targets are located anew
+vesselTTL = 300.0   # Seconds a vessel is kept without a word from it
+baseStationTTL = 900.0   # Ditto, a base station
+logRate = 1000.0   # Bytes per second taken to pass in logs, by decodeLog()
+clockKeys = ('k0_SYSTEMCLOCK', 'k0_SECONDS')  # Refreshed with every record
+# Records carry an error code flag in 'k0_TRUBBEL', a.k.a. spurio: 'ok' 
+# (Valid IDs: # 01 == Lat out of bounds, 02 == Ditto for Lon)
 ticker = 0
-systemClock = ''
-nillString = ''
-foundPort = ''
-obsodelete = False  # Ripe-for-deletion flag.
-timeOutTime = 0   # Ticker to trigger the sweep-up. Used to set the frequency of one-shot deletions.
-myOrigo = ()  # This var is either set with myPosGPS or updated by the live GPS input
-fSize = 0
 
 
 
@@ -1279,6 +2510,13 @@ ipf = '/home/xneb/.wine/drive_c/Program Files/AISMon/AISMon.log'
 #myPosGPS = staticPos232 = ('59.463333', 'N', '18.05', 'E') # (Decimal degrees)
 #myPosGPS = staticPosSandhamnsBoj = ('59.28351', 'N', '18.925208', 'E')
 
+	## Own ship's position for decoding archived logs (see batchMain())
+batchOrigo = ('59.463333', 'N', '18.05', 'E')
+
+	## More AIS inputs, besides ipf: serial devices and NMEA servers over TCP
+aisSerialPorts = []		#cp [('/dev/ttyUSB1', 38400)]
+aisServers = []			#cp [('localhost', 10110)]
+
 	## The myOffset constant is useful for simulation and debugging with GPS input. 
 	## Defaults to nil:                                                             
 myOffset = (0, 0)				  	#cp myPosGPS = ('59.463333', 'N', '18.05', 'E')
@@ -1291,136 +2529,133 @@ myOffset = (0, 0)				  	#cp myPosGPS = ('59.463333', 'N', '18.05', 'E')
 # ------------------------- Init routines---------------------------
 # ##################################################################
 
-
-	## Start the wxPython GUI already 
-child1 = subprocess.Popen('./AISflukt/AISflukt.py')
-time.sleep(0.5)
-
-	## Start the Pygame GUI "Radar Plotter"
-child2 = subprocess.Popen('./Ployplot.py')
+def main():
+	''' Runs PupAIS: starts the GUIs and the GPS, then decodes the AIS 
+	input into the census file until the PupAIS window is closed.
+	'''
+	global ticker
+	from pyglet import gl, image, text as tt, window as ww
 
 ## ------------ Comment out the following lines in static origo mode --------------
 
-	## Identify, open and prime the serial port used by the GPS dongle
-foundPort = str(portScanUSB())
-ser = serial.Serial(foundPort, 4800, timeout=1)
-ser.baudrate = 4800 		# Is this redundant?
-ggr = 0
-while ggr < 4:
-	ggr = ggr + 1
-	ser.readline()
-	time.sleep(0.25)
+		## Identify, open and prime the serial port used by the GPS dongle, 
+		## in the background
+	gps = GPSReader()
+	gps.start()
 
 ## ------------ Comment out the preceding lines in static origo mode --------------
 
+		## Start the wxPython GUI already 
+	child1 = subprocess.Popen('./AISflukt/AISflukt.py')
+
+		## Start the Pygame GUI "Radar Plotter"
+	child2 = subprocess.Popen('./Ployplot.py')
 
-	## Pyglet stuff -- Forge a window to end them all!
-funster = ww.Window(width = 400, height = 55, caption = 'PupAIS')
-x, y = funster.get_location()
-funster.set_location(x - 5, y + 475)
-blue = (0,0,0.5,1)
-gl.glClearColor(*blue)
-label = tt.Label('PupAIS is now running headless in the background. 	\n\
+
+		## Pyglet stuff -- Forge a window to end them all!
+	funster = ww.Window(width = 400, height = 55, caption = 'PupAIS')
+	x, y = funster.get_location()
+	funster.set_location(x - 5, y + 475)
+	blue = (0,0,0.5,1)
+	gl.glClearColor(*blue)
+	label = tt.Label('PupAIS is now running headless in the background. 	\n\
 Please close this window to kill the associated\n\
 processes in an orderly way -- zombies and all!',
-font_name = 'Lucida Sans Typewriter',
-font_size = 8,
-color = (255,255,255,255), 
-x = funster.width//2, y = funster.height//2,
-anchor_x = 'center', anchor_y = 'center',
-multiline = True,
-width = 380)
-pic = image.load('./data/pngs/popeye_smallest.png')		
-pic.anchor_x = -315
-pic.anchor_y = 90
+	font_name = 'Lucida Sans Typewriter',
+	font_size = 8,
+	color = (255,255,255,255), 
+	x = funster.width//2, y = funster.height//2,
+	anchor_x = 'center', anchor_y = 'center',
+	multiline = True,
+	width = 380)
+	pic = image.load('./data/pngs/popeye_smallest.png')		
+	pic.anchor_x = -315
+	pic.anchor_y = 90
+
+	decoder = AISDecoder(offset=myOffset)
+
+	## Pick up where we left off, if we've run before
+	positions = loadCheckpoint(checkpointFile, decoder, popuStore)
+	savedTime = time.time()
+	if len(popuStore):
+		print 'Resuming with', len(popuStore), 'targets'
+		popuWrite(popuStore)
+
+	## Our inputs, each read by a thread of its own (see startSources())
+	inode, offset = positions.get('AISMon', (None, 0))
+	sources = {'AISMon' : LogTail(ipf, offset, inode)}
+	for device, baudrate in aisSerialPorts:
+		sources['AIS ' + device] = serialLines(device, baudrate)
+	for host, port in aisServers:
+		sources['AIS %s:%s' % (host, port)] = tcpLines(host, port)
+	myOrigo = gps.origo   ## If using live GPS input: the latest fix, when needed
+#	myOrigo = myPosGPS     ## If using static coordinates
+	feed = startSources(sources)
 
 # ##################################################################
 # -------------------------- Main loop -----------------------------
 # ##################################################################
 
-while not funster.has_exit: # State of the Pyglet window controls the main loop
-	funster.dispatch_events()
-	funster.clear()	
-	label.draw()
-	pic.blit(x, y)
-	funster.flip()
-	
-	f = file(ipf)   # (Re-)establish the input file object
-	fSize = os.path.getsize(ipf)  # Test whether input file has any (new) contents
-	while fSize > 0:			  # See note in def flushLog()
-		print "Sync #", ticker, "  (fSize is now:", fSize,")"
-		inputt = f.readline() 
-		if len(inputt) == 0: # Nothing left to read: Delete all lines and reload
-			print "Now flushing" 
-			f.close()
-			flushLog(ipf)	## Comment this line out in simulation modes
-			time.sleep(1)	# No need to haste... Let's idle awhile
-			f = file(ipf) 	# We must not forget to open the flushed input file again
-			break
-		if len(inputt) <= 4 and str('\n') in inputt: # Empty lines in file?
-			ticker = ticker + 1
-			continue
-		try:
-			data, cksum, calc_cksum = checkSumCheck(inputt)  # Does it check out?
-		except ValueError:
-			break
-		if cksum != calc_cksum:
-			print 'Error in checksum for: %s' % (data)
-			break
-		else:		    ##     At last we can go to work!     
+	while not funster.has_exit: # State of the Pyglet window controls the main loop
+		funster.dispatch_events()
+		funster.clear()	
+		label.draw()
+		pic.blit(x, y)
+		funster.flip()
+		
+		drawn = time.time()
+		while time.time() - drawn < 1:   # Back to the window about once a second
+			try:
+				source, inputt, position = feed.get(timeout=0.25)
+			except Queue.Empty:
+				continue
+			if position is not None:
+				positions[source] = position
+			print "Sync #", ticker, "  (from", source, ")"
+			if inputt.startswith('$'):  # Not AIS, but e.g. a GPS talking on the feed
+				continue
+			if len(inputt) <= 4 and str('\n') in inputt: # Empty lines in file?
+				ticker = ticker + 1
+				continue
+			now = time.time()
+			try:		    ##     At last we can go to work!     
+				records = decoder.decode(inputt, myOrigo, now)
+			except ValueError, error:  # Garbled, or the checksum doesn't check out
+				print error
+				continue
 			ticker = ticker + 1
-			systemClock = time.strftime('%H:%M:%S',time.localtime())
-			secondsUp = str(3600*int(systemClock[:2])+60*int(systemClock[3:5])+int(systemClock[6:]))
-			partsCount, partNumber, sequentID, payLoad = decapsulate(inputt)
-			idBits = messageType(str2Bitstr(payLoad [:6]))
-			myOrigo = findOrigo() ## If using live GPS input
-#			myOrigo = myPosGPS     ## If using static coordinates
-			if partsCount == '1':
-	#				fPrint(1)
-				if idBits == '01' :
-					CommonNavigationBlock()
-				elif idBits == '02' :
-					CommonNavigationBlock()
-				elif idBits == '03' :
-					CommonNavigationBlock()
-				elif idBits == '04' :
-					BaseStationReport()
-				else:
-	#				fPrint(2)   
-					pass     # No significance to us, so just ignore it...
-			elif partsCount == '2':
-				if idBits == '05':
-					if partNumber == '1':
-						stashedPart = payLoad
-						stashedSequentID = sequentID
-				else:
-					if stashedSequentID == sequentID:
-	#					fPrint(1)
-						ShipTripData()
-					else:
-						if idBits != '01':
-	#						fPrint(1)
-	#						fPrint(4)
-							pass
-						else:
-							continue
+			changed = False
+			for record in records:
+#				fPrint(1)
+				changed = upDatePPL(record) or changed
+			if changed:
+				popuWrite(popuStore)
+		expired = popuStore.expire()   # This reduces the list-length for both \
+										# PopuLister and PloyPlotter!
+		for shipfile in expired:
+			print 'Deleting', shipfile['k0_MMSI'], ', not blipped since ',shipfile['k0_SYSTEMCLOCK']
+		if expired:
+			popuWrite(popuStore)
+		if len(popuStore):    # Own ship moving on: the whole fleet's ranges and bearings follow
+			if callable(myOrigo):
+				origin = origoDegrees(myOrigo(), myOffset)
 			else:
-	#			fPrint(1)
-	#			fPrint(3)
-				pass
-		if timeOutTime > 112: # Another half-minute has passed (approx in non-idling state). Time to sweep up.
-	#		print '+++++++++    Here we go again @', ticker
-			if obsodelete == True:
-				print 'Deleting', popuList[0]['k0_MMSI'], ', not blipped since ',popuList[0]['k0_SYSTEMCLOCK']
-				del popuList[0]# This now reduces the list-length for both \
-								# PopuLister and PloyPlotter!
-				obsodelete = False
-			timeOutTime = 0
-		timeOutTime += 1
-		time.sleep(.25)   # A loop delay is needed for termination (?). Also for the correct timeOutTime time-scale!
-	print "idling..."
-	time.sleep(1)
-child2.terminate()
-child1.terminate()
-f.close() 
-print "                 Bye-bye Superfly!"
+				origin = origoDegrees(myOrigo, myOffset)
+			if popuStore.refix(origin):
+				popuWrite(popuStore)
+		if time.time() - savedTime > checkpointInterval:
+			saveCheckpoint(checkpointFile, positions, decoder, popuStore)
+			savedTime = time.time()
+			print 'Target store:', popuStore.usage()
+	saveCheckpoint(checkpointFile, positions, decoder, popuStore)
+	print 'Target store:', popuStore.usage()
+	child2.terminate()
+	child1.terminate()
+	print "                 Bye-bye Superfly!"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:   # Decoding archived logs: PupAIS_eee.py LOG...
+		batchMain(sys.argv[1:])
+	else:
+		main()